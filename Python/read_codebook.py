@@ -53,10 +53,10 @@ def df_to_col_names(df):
     
     arrays_df = df[df['type'] == 'array'][['name', 'start', 'end']]
     
-    rec_struct = rec_struct.append(
+    rec_struct = pd.concat([rec_struct,
         arrays_df.apply(
-            lambda x: [x[0] + str(i) for i in range(int(x[1]), int(x[2]) + 1)],
-            axis=1).explode(), 
+            lambda x: [x.iloc[0] + str(i) for i in range(int(x.iloc[1]), int(x.iloc[2]) + 1)],
+            axis=1).explode()],
         ignore_index=True)
 
     return rec_struct
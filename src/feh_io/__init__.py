@@ -1,9 +1,56 @@
 """
-Intialization file necessary for the package to be recognized as a module. 
+Intialization file necessary for the package to be recognized as a module.
 
-This can be empty.
+Public names are imported from their modules on first access, so that
+`import feh_io` stays cheap: pandas, pyarrow and requests are only loaded
+when a feature that needs them is used.
 """
-from .read_feh import read_feh_data_file, read_header_file, feh_wide_to_long
-from .feh_reader import FehReader
-from .save_feh import save_feh_parquet
-from .data_manager import DataManager
\ No newline at end of file
+import importlib
+
+# Public name -> module that defines it
+_EXPORTS = {
+    'read_feh_data_file': 'read_feh',
+    'read_header_file': 'read_feh',
+    'feh_wide_to_long': 'read_feh',
+    'FehReader': 'feh_reader',
+    'ConcurrentFehReader': 'feh_reader',
+    'save_feh_parquet': 'save_feh',
+    'save_feh_parquet_dataset': 'save_feh',
+    'save_feh_arrow': 'save_feh',
+    'load_feh_arrow': 'read_feh',
+    'parse_codebook': 'codebook',
+    'read_feh_char_file': 'codebook',
+    'FehDataset': 'feh_dataset',
+    'FehFrame': 'feh_frame',
+    'sample_feh': 'sample_feh',
+    'sort_feh_file': 'sort_feh',
+    'SharedFehArray': 'shared_feh',
+    'mts_matrix': 'mts',
+    'cumulative_sum': 'mts',
+    'lifetime_sum': 'mts',
+    'top_n_mean': 'mts',
+    'first_nonzero_year': 'mts',
+    'last_nonzero_year': 'mts',
+    'count_years': 'mts',
+    'SparseMts': 'sparse_mts',
+    'ScenarioStore': 'scenario_store',
+    'feh_record_batch_reader': 'arrow_source',
+    'FehScanner': 'arrow_source',
+    'transition_counts': 'transitions',
+    'DataManager': 'data_manager',
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+
+    # Cache so that later accesses skip __getattr__
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
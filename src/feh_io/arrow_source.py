@@ -0,0 +1,198 @@
+"""
+Arrow sources over DYNASIM-FEH data files.
+
+DuckDB, polars and pyarrow.compute can query a pyarrow.RecordBatchReader as
+it streams, so a data file can be queried without converting it to parquet
+first. feh_record_batch_reader wraps FehReader as one such stream.
+FehScanner splits an uncompressed data file into record-aligned fragments
+that are read from a memory map on a thread pool and streamed back in file
+order:
+
+    scanner = FehScanner(header_file, person_file, columns=['PERNUM', 'EARNINGS'], years=(2006, 2010))
+    reader = scanner.to_reader()
+    duckdb.sql("SELECT avg(EARNINGS2008) FROM reader")
+
+In both, columns may name MTS variables (e.g. 'EARNINGS'), which stand for
+their yearly fields, and years limits those fields to a window. Fragments
+and batches are sized in bytes of the selected fields, and only those
+fields are copied out of the file, so memory use does not grow with the
+record width or the file size.
+"""
+from feh_io.feh_reader import FehReader
+from feh_io.read_feh import get_record_dict, make_rec_dtype, get_mts_years, select_vars, convert_output, read_record_fields
+from feh_io.compression import detect_compression
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque, namedtuple
+import itertools
+import os
+import numpy as np
+
+# Target size of each fragment or batch, in bytes of the selected fields
+ARROW_BATCH_BYTES = 16 * 2**20
+
+FehFragment = namedtuple('FehFragment', ['data_file', 'start', 'stop'])
+
+def resolve_fields(header_file:str, file_type:str = 'person', columns:list = None, years:tuple = None):
+    """Expands columns to the record fields to read
+
+    Args:
+        header_file (str): the path to a DYNASIM header file
+        file_type (str): 'person' or 'family' file. Defaults to 'person'.
+        columns (list, optional): scalar fields, MTS fields (EARNINGS2008) or
+            MTS variables (EARNINGS). All fields if None; with years, all
+            scalar variables and the years of every MTS variable.
+        years (tuple, optional): (first, last) years, inclusive, of the MTS
+            variables to keep. All years if None.
+
+    Returns:
+        tuple: record dtype and list of fields
+    """
+    rec = get_record_dict(header_file, file_type)
+    rectype = make_rec_dtype(rec)
+    mts_years = get_mts_years(rec)
+    first, last = (-np.inf, np.inf) if years is None else years
+
+    if columns is None and years is None:
+        return rectype, list(rectype.names)
+
+    if columns is None:
+        scalars = [name for name in (n.strip() for n in rec['names']) if name not in mts_years]
+        columns = scalars + list(mts_years)
+
+    fields = []
+    for column in columns:
+        if column in mts_years:
+            ly, hy = mts_years[column]
+            fields += [f"{column}{y}" for y in range(max(ly, first), min(hy, last) + 1)]
+        else:
+            fields.append(column)
+
+    missing_vars = [field for field in fields if field not in rectype.names]
+    if missing_vars:
+        raise ValueError(f"Fields missing from the data:\n{missing_vars}\n"
+                         f"\nAvailable variables are:\n{rectype.names}")
+
+    return rectype, list(dict.fromkeys(fields))
+
+def _arrow_schema(rectype, fields:list):
+    return convert_output(select_vars(np.empty(0, rectype), fields), 'arrow').schema
+
+def _batch_records(rectype, fields:list, batch_bytes:int):
+    """Number of records whose selected fields take about batch_bytes"""
+    width = sum(rectype.fields[field][0].itemsize for field in fields)
+    return max(1, batch_bytes // max(1, width))
+
+def feh_record_batch_reader(header_file:str, data_file:str, file_type:str = 'person', columns:list = None,
+                            years:tuple = None, batch_records:int = None):
+    """Streams a raw or compressed data file as a pyarrow.RecordBatchReader.
+       Raw files are read from a memory map, one batch at a time; compressed
+       files are decompressed through FehReader, which selects the fields of
+       each decompressed buffer.
+
+    Args:
+        header_file (str): the path to a DYNASIM header file
+        data_file (str): the path to a raw or compressed DYNASIM data file
+        file_type (str): 'person' or 'family' file. Defaults to 'person'.
+        columns (list, optional): fields or MTS variables to read, all if None
+        years (tuple, optional): (first, last) years of MTS variables
+        batch_records (int, optional): number of records in each batch,
+            about ARROW_BATCH_BYTES of selected fields if None
+
+    Returns:
+        pa.RecordBatchReader: stream of record batches
+    """
+    import pyarrow as pa
+
+    rectype, fields = resolve_fields(header_file, file_type, columns, years)
+    batch_records = batch_records or _batch_records(rectype, fields, ARROW_BATCH_BYTES)
+
+    if detect_compression(data_file) is None:
+        scanner = FehScanner(header_file, data_file, file_type, columns, years,
+                             fragment_records=batch_records, use_threads=False)
+        return scanner.to_reader()
+
+    reader = FehReader(header_file, data_file, file_type, chunk_size=batch_records, var_list=fields, output='arrow')
+
+    def batches():
+        try:
+            while True:
+                table = reader.read_chunk()
+                if table.num_rows == 0:
+                    return
+                yield from table.to_batches()
+        finally:
+            reader.close()
+
+    return pa.RecordBatchReader.from_batches(_arrow_schema(rectype, fields), batches())
+
+def _read_fragment(fragment:FehFragment, rectype, fields:list):
+    """Copies the selected fields of one fragment out of the memory-mapped file"""
+    return convert_output(read_record_fields(fragment.data_file, rectype, fields, fragment.start, fragment.stop), 'arrow')
+
+class FehScanner:
+    """
+    Class scanning an uncompressed data file as record-aligned fragments,
+    in the manner of a pyarrow dataset scanner.
+    """
+    def __init__(self, header_file:str, data_file:str, file_type:str = 'person', columns:list = None,
+                 years:tuple = None, fragment_records:int = None, use_threads:bool = True,
+                 max_workers:int = None):
+        if detect_compression(data_file) is not None:
+            raise ValueError(f"Fragments need an uncompressed data file, use feh_record_batch_reader: {data_file}")
+
+        self.header_file = header_file
+        self.data_file = data_file
+        self.file_type = file_type
+        self.use_threads = use_threads
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+        self.rectype, self.fields = resolve_fields(header_file, file_type, columns, years)
+        self.fragment_records = fragment_records or _batch_records(self.rectype, self.fields, ARROW_BATCH_BYTES)
+        self.nrec = os.path.getsize(data_file) // self.rectype.itemsize
+
+    def __repr__(self):
+        return (f"FehScanner({self.data_file!r}, records={self.nrec}, fields={len(self.fields)}, "
+                f"fragments={len(self.get_fragments())})")
+
+    @property
+    def schema(self):
+        return _arrow_schema(self.rectype, self.fields)
+
+    def count_rows(self):
+        return self.nrec
+
+    def get_fragments(self):
+        """Splits the file into FehFragment record ranges"""
+        return [FehFragment(self.data_file, start, min(start + self.fragment_records, self.nrec))
+                for start in range(0, self.nrec, self.fragment_records)]
+
+    def to_batches(self):
+        """Reads fragments, on a thread pool if use_threads, and yields their
+           record batches in file order. At most max_workers fragments are in
+           memory besides the one being consumed."""
+        fragments = self.get_fragments()
+
+        if not self.use_threads:
+            for fragment in fragments:
+                yield from _read_fragment(fragment, self.rectype, self.fields).to_batches()
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            fragments = iter(fragments)
+            pending = deque(executor.submit(_read_fragment, fragment, self.rectype, self.fields)
+                            for fragment in itertools.islice(fragments, self.max_workers))
+            while pending:
+                table = pending.popleft().result()
+                for fragment in itertools.islice(fragments, 1):
+                    pending.append(executor.submit(_read_fragment, fragment, self.rectype, self.fields))
+                yield from table.to_batches()
+
+    def to_reader(self):
+        """Streams the fragments as a pyarrow.RecordBatchReader"""
+        import pyarrow as pa
+        return pa.RecordBatchReader.from_batches(self.schema, self.to_batches())
+
+    def to_table(self):
+        """Reads all fragments into one pyarrow Table"""
+        import pyarrow as pa
+        return pa.Table.from_batches(list(self.to_batches()), schema=self.schema)
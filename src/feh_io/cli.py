@@ -0,0 +1,183 @@
+"""
+Command line interface for feh_io.
+
+    feh-io convert RUN_DIR [RUN_DIR ...] --out OUT_DIR [--root ROOT] [--workers N]
+
+converts every person and family file found under the run directories to
+parquet on a process pool. Outputs mirror the paths of the data files under
+ROOT, or under the parent of their run directory without one. A manifest in the output directory records the
+size, modification time and header hash of each converted input, so files
+that have not changed since the last conversion are skipped. Outputs and the
+manifest are written atomically, and the manifest is updated after every
+file, so an interrupted batch resumes where it stopped.
+"""
+from feh_io.feh_dataset import discover_partitions
+from feh_io.save_feh import convert_feh_parquet, CONVERT_CHUNK_SIZE
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+
+MANIFEST_NAME = 'feh-manifest.json'
+
+def file_signature(header_file:str, data_file:str):
+    """Describes the inputs of a conversion
+
+    Args:
+        header_file (str): the path to a DYNASIM header file
+        data_file (str): the path to a DYNASIM data file
+
+    Returns:
+        dict: size and mtime_ns of the data file and sha256 of the header
+    """
+    with open(header_file, 'rb') as file:
+        header_hash = hashlib.sha256(file.read()).hexdigest()
+
+    stat = os.stat(data_file)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'header_sha256': header_hash}
+
+def read_manifest(manifest_path:str):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r') as file:
+        return json.load(file)
+
+def write_manifest(manifest:dict, manifest_path:str):
+    """Writes the manifest under a temporary name and renames it into place"""
+    tmp_path = f"{manifest_path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def plan_conversions(run_dirs:list, out_dir:str, root:str = None):
+    """Lists the conversions for all person and family files under run_dirs.
+       Outputs mirror the paths of the data files relative to root, or to
+       the parent of their run directory if root is None, so each run lands
+       in the same place whatever other runs are converted with it. Runs
+       that share a directory name (e.g. run-1006-baseline/base-v8 and
+       run-1007-reform/base-v8) need a root to stay apart.
+
+    Args:
+        run_dirs (list): DYNASIM run directories
+        out_dir (str): output directory
+        root (str, optional): directory containing all run directories
+
+    Returns:
+        list: (header_file, data_file, file_type, output_file) tuples
+    """
+    run_dirs = list(dict.fromkeys(os.path.abspath(run_dir) for run_dir in run_dirs))
+    root = None if root is None else os.path.abspath(root)
+
+    tasks = []
+    outputs = {}
+    inputs = set()
+    for run_dir in run_dirs:
+        parent = os.path.dirname(run_dir) if root is None else root
+        if os.path.commonpath([parent, run_dir]) != parent:
+            raise ValueError(f"Run directory {run_dir} is not under the root {root}")
+
+        for p in discover_partitions(run_dir):
+            data_file = os.path.abspath(p.data_file)
+            if data_file in inputs:
+                raise ValueError(f"{data_file} is under more than one of the run directories")
+            inputs.add(data_file)
+
+            rel = os.path.relpath(os.path.dirname(data_file), parent)
+            name = re.sub(r'\.dat(\.\w+)?$', '', os.path.basename(data_file), flags=re.IGNORECASE)
+            out_file = os.path.normpath(os.path.join(out_dir, rel, f"{name}.parquet"))
+
+            if out_file in outputs:
+                raise ValueError(f"{p.data_file} and {outputs[out_file]} would both be converted to {out_file}, "
+                                 f"pass a root directory to keep their run directories apart")
+            outputs[out_file] = p.data_file
+
+            tasks.append((p.header_file, p.data_file, p.file_type, out_file))
+    return tasks
+
+def _convert(header_file:str, data_file:str, file_type:str, out_file:str, chunk_size:int):
+    """Converts one file in a worker process"""
+    os.makedirs(os.path.dirname(out_file), exist_ok=True)
+    return convert_feh_parquet(header_file, data_file, out_file, file_type, chunk_size=chunk_size)
+
+def convert(run_dirs:list, out_dir:str, workers:int = None, chunk_size:int = CONVERT_CHUNK_SIZE, force:bool = False,
+            root:str = None):
+    """Converts run directories to parquet, skipping files that are unchanged
+       and planned to the same output as last time
+
+    Args:
+        run_dirs (list): DYNASIM run directories
+        out_dir (str): output directory, also holds the manifest
+        workers (int, optional): number of worker processes, all cores if None
+        chunk_size (int, optional): number of records read at a time
+        force (bool, optional): convert files even if they are unchanged
+        root (str, optional): directory containing all run directories,
+            outputs mirror paths relative to it
+
+    Returns:
+        dict: counts of 'converted', 'skipped' and 'failed' files
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    manifest = read_manifest(manifest_path)
+    counts = {'converted': 0, 'skipped': 0, 'failed': 0}
+
+    # Work out which files have changed since the last conversion
+    pending = []
+    for header_file, data_file, file_type, out_file in plan_conversions(run_dirs, out_dir, root):
+        key = os.path.abspath(data_file)
+        signature = file_signature(header_file, data_file)
+        entry = manifest.get(key)
+        # A moved output counts as a change, even if the input is the same
+        if (not force and entry is not None and entry['output'] == out_file and os.path.exists(out_file)
+                and all(entry[k] == v for k, v in signature.items())):
+            counts['skipped'] += 1
+            continue
+        pending.append((key, signature, (header_file, data_file, file_type, out_file, chunk_size)))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_convert, *args): (key, signature, args[3])
+                   for key, signature, args in pending}
+
+        for future in as_completed(futures):
+            key, signature, out_file = futures[future]
+            try:
+                nrec = future.result()
+            except Exception as e:
+                counts['failed'] += 1
+                print(f"Failed to convert {key}: {e}", file=sys.stderr)
+                continue
+
+            # Record each finished file right away so a crash loses no work
+            manifest[key] = dict(signature, output=out_file, records=nrec)
+            write_manifest(manifest, manifest_path)
+            counts['converted'] += 1
+            print(f"Converted {key} -> {out_file} ({nrec} records)")
+
+    return counts
+
+def main(argv:list = None):
+    parser = argparse.ArgumentParser(prog='feh-io', description='Tools for DYNASIM FEH files')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help='convert run directories to parquet')
+    convert_parser.add_argument('run_dirs', nargs='+', help='DYNASIM run directories')
+    convert_parser.add_argument('--out', required=True, help='output directory')
+    convert_parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    convert_parser.add_argument('--chunk-size', type=int, default=CONVERT_CHUNK_SIZE,
+                                help='number of records read at a time')
+    convert_parser.add_argument('--root', default=None,
+                                help='directory containing the run directories, outputs mirror paths under it')
+    convert_parser.add_argument('--force', action='store_true', help='convert unchanged files too')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'convert':
+        counts = convert(args.run_dirs, args.out, args.workers, args.chunk_size, args.force, args.root)
+        print(f"{counts['converted']} converted, {counts['skipped']} skipped, {counts['failed']} failed")
+        return 1 if counts['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
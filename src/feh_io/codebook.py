@@ -0,0 +1,251 @@
+"""
+Functions for reading DYNASIM-FEH codebooks and character-mode data files.
+
+A DYNASIM codebook (e.g. codebook_2087ds.sipp2006) describes a fixed-width
+ASCII layout ('MODE: CHAR'). Each record section lists its variables with
+their column positions, and micro-time-series (MTS) variables also carry
+their year range:
+
+    V- EARNINGS(1951-2087)     COLUMN: 62- 67   MTS:INOUT;
+
+parse_codebook turns a codebook into a layout dictionary, and
+read_feh_char_file uses that layout to decode a character-mode data file
+into a structured numpy array.
+"""
+
+import os
+import re
+import numpy as np
+
+# One pattern for every statement of interest in a codebook. Comment lines
+# start with ';' and never match because statements must start a line.
+_CODEBOOK_RE = re.compile(r"""
+    ^[ \t]*(?:
+        FILE-\s*(?P<file>\S+)\s+MODE:\s*(?P<mode>\w+)\s+BASE:\s*(?P<base>\d+)
+      | RECORD-\s*(?P<record>\w+)\s+LEVEL:\s*(?P<level>\d+)
+      | V-\s*(?P<name>\w+)(?:\((?P<mtsly>\d+)-(?P<mtshy>\d+)\))?
+            \s+COLUMN:\s*(?P<start>\d+)\s*-\s*(?P<end>\d+)
+            (?:\s+MTS:(?P<mtsio>\w+))?
+      | (?P<endvars>ENDVARS)
+    )\s*;""", re.MULTILINE | re.VERBOSE)
+
+# Number of records decoded at a time by read_feh_char_file
+CHAR_CHUNK_SIZE = 100_000
+
+def _new_record(level:int):
+    """Creates an empty record layout dictionary
+
+    Args:
+        level (int): record level given in the codebook
+
+    Returns:
+        dict: record layout with empty lists for every attribute
+    """
+    return {'level': level, 'names': [], 'start': [], 'end': [], 'width': [],
+            'mtsly': [], 'mtshy': [], 'mtsio': [], 'rlen': 0}
+
+def parse_codebook(filename:str):
+    """Parses a DYNASIM codebook into a fixed-width layout.
+       The whole codebook is scanned once with a single compiled pattern.
+
+    Args:
+        filename (str): the path to a DYNASIM codebook
+
+    Returns:
+        dict: A dictionary with the following elements:
+            file: file name given in the codebook
+            mode: storage mode, e.g. 'CHAR'
+            base: base year of the file
+            family: family-record layout
+            person: person-record layout
+        Each record layout is a dictionary with the following elements:
+            level: record level
+            names: list of variable names
+            start: list of first columns (1-based, inclusive)
+            end:   list of last columns (1-based, inclusive)
+            width: list of field widths
+            mtsly: list of first MTS years, 0 for scalar variables
+            mtshy: list of last MTS years, 0 for scalar variables
+            mtsio: list of MTS directions ('IN', 'OUT', 'INOUT'), '' for scalars
+            rlen:  record length, i.e. the last column used by the record
+    """
+
+    with open(filename, 'r') as file:
+        text = file.read()
+
+    layout = {'file': None, 'mode': None, 'base': None}
+    rec = None
+
+    for m in _CODEBOOK_RE.finditer(text):
+        if m.group('name') is not None:
+            if rec is None:
+                raise ValueError(f"Variable {m.group('name')} is defined outside of a RECORD section")
+            start, end = int(m.group('start')), int(m.group('end'))
+            rec['names'].append(m.group('name'))
+            rec['start'].append(start)
+            rec['end'].append(end)
+            rec['width'].append(end - start + 1)
+            rec['mtsly'].append(int(m.group('mtsly') or 0))
+            rec['mtshy'].append(int(m.group('mtshy') or 0))
+            rec['mtsio'].append(m.group('mtsio') or '')
+            rec['rlen'] = max(rec['rlen'], end)
+
+        elif m.group('record') is not None:
+            rec = _new_record(int(m.group('level')))
+            layout[m.group('record').lower()] = rec
+
+        elif m.group('endvars') is not None:
+            rec = None
+
+        else:
+            layout['file'] = m.group('file')
+            layout['mode'] = m.group('mode')
+            layout['base'] = int(m.group('base'))
+
+    if 'family' not in layout or 'person' not in layout:
+        raise ValueError(f"ERROR: Codebook invalid, FAMILY and PERSON records are required: {filename}")
+
+    return layout
+
+def make_char_dtype(rec:dict, var_list:list = None):
+    """Creates a dtype object based on a record layout from a codebook.
+       Fields of up to 9 digits are stored as i4, wider fields as i8.
+
+    Args:
+        rec (dict): a record layout created by parse_codebook
+        var_list (list, optional): variables to include, all if None
+
+    Returns:
+        dtype: A dtype object for a numpy structured array
+    """
+    names = rec['names'] if var_list is None else var_list
+    widths = dict(zip(rec['names'], rec['width']))
+
+    missing_vars = [var for var in names if var not in widths]
+    if missing_vars:
+        raise ValueError(f"Fields missing from the codebook:\n{missing_vars}\n"
+                         f"\nAvailable variables are:\n{rec['names']}")
+
+    formats = ['i4' if widths[name] <= 9 else 'i8' for name in names]
+
+    return np.dtype({'names': list(names), 'formats': formats})
+
+def get_char_record_width(data_file:str):
+    """Finds the width of a record in a character-mode file, line terminator included
+
+    Args:
+        data_file (str): the path to a character-mode data file
+
+    Returns:
+        int: number of bytes per record
+    """
+    with open(data_file, 'rb') as file:
+        first_block = file.read(1 << 16)
+
+    newline = first_block.find(b'\n')
+    if newline < 0:
+        raise ValueError(f"No record terminator found in the first 64KB of {data_file}")
+
+    return newline + 1
+
+def decode_digits(block):
+    """Converts a 2-D block of ASCII digits into integers, one per row.
+       Blanks and other non-digit characters are skipped and a '-'
+       anywhere in the field makes the value negative, so both left- and
+       right-justified fields are decoded.
+
+    Args:
+        block (np.array): uint8 array of shape (records, field width)
+
+    Returns:
+        np.array: int64 array with one value per record
+    """
+    is_digit = (block >= ord('0')) & (block <= ord('9'))
+    digits = np.where(is_digit, block - ord('0'), 0).astype(np.int64)
+
+    # Power of ten for each digit is the number of digits to its right
+    places = np.cumsum(is_digit[:, ::-1], axis=1)[:, ::-1] - is_digit
+    powers = np.power(10, np.arange(block.shape[1], dtype=np.int64))
+
+    values = (digits * powers[places]).sum(axis=1)
+    values[(block == ord('-')).any(axis=1)] *= -1
+
+    return values
+
+def read_feh_char_file(
+        codebook,
+        data_file:str,
+        var_list:list = None,
+        file_type:str = 'person',
+        count:int = -1,
+        offset:int = 0,
+        chunk_size:int = CHAR_CHUNK_SIZE):
+    """Reads a character-mode (MODE: CHAR) DYNASIM data file.
+       The file is viewed as a 2-D uint8 array with one row per record and
+       every field is decoded column-wise for a whole chunk of records at
+       once. MTS variables are decoded from their codebook columns under
+       their base name.
+
+    Args:
+        codebook (str|dict): the path to a DYNASIM codebook or a layout
+            created by parse_codebook
+        data_file (str): the path to a character-mode data file
+        var_list (list, optional): variables to decode, all if None
+        file_type (str): 'person' or 'family' file. Defaults to 'person'.
+        count (int, optional): number of records to read, all if -1.
+            Defaults to -1.
+        offset (int, optional): number of bytes to skip before reading.
+            Defaults to 0.
+        chunk_size (int, optional): number of records decoded at a time.
+
+    Returns:
+        numpy structured array: data
+    """
+    layout = codebook if isinstance(codebook, dict) else parse_codebook(codebook)
+
+    if file_type not in ['person', 'family']:
+        raise ValueError(f"file_type can be 'person' or 'family' but not {file_type}")
+    rec = layout[file_type]
+
+    rectype = make_char_dtype(rec, var_list)
+    columns = dict(zip(rec['names'], zip(rec['start'], rec['end'])))
+
+    # Every record has the same width, including its line terminator,
+    # except that the last one may have no terminator
+    width = get_char_record_width(data_file)
+    with open(data_file, 'rb') as file:
+        terminator = 2 if file.read(width).endswith(b'\r\n') else 1
+    nbytes = os.path.getsize(data_file) - offset
+    tail = nbytes % width
+    if tail not in (0, width - terminator):
+        raise ValueError(f"Records in {data_file} are not all {width} bytes long")
+    if rec['rlen'] > width - 1:
+        raise ValueError(f"Records in {data_file} are {width} bytes long, "
+                         f"but the codebook uses {rec['rlen']} columns")
+
+    nfull = nbytes // width
+    nrec = nfull + (tail > 0)
+    if count >= 0:
+        nrec = min(nrec, count)
+
+    data = np.empty(nrec, dtype=rectype)
+    if nrec == 0:
+        return data
+
+    raw = np.memmap(data_file, dtype=np.uint8, mode='r', offset=offset, shape=(min(nrec, nfull), width))
+    if nrec > nfull:
+        # Unterminated last record, padded to the full width
+        last = np.zeros((1, width), dtype=np.uint8)
+        with open(data_file, 'rb') as file:
+            file.seek(offset + nfull * width)
+            last[0, :tail] = np.frombuffer(file.read(tail), dtype=np.uint8)
+
+    for lo in range(0, nrec, chunk_size):
+        hi = min(lo + chunk_size, nrec)
+        # One contiguous read per chunk, then column slices are in memory
+        chunk = np.array(raw[lo:hi]) if hi <= nfull else np.concatenate([raw[lo:nfull], last])
+        for name in rectype.names:
+            start, end = columns[name]
+            data[name][lo:hi] = decode_digits(chunk[:, start-1:end])
+
+    return data
@@ -0,0 +1,162 @@
+"""
+Functions for reading compressed DYNASIM-FEH data files.
+
+Archived DYNASIM runs are often stored compressed with gzip, xz or
+zstandard. The compression is detected from the first bytes of the file,
+not its extension, and records are decompressed as a stream into a
+reusable chunk buffer, so no scratch copy of the file is written to disk.
+
+zstandard support requires the optional 'zstandard' package (or the
+standard library 'compression.zstd' module on Python 3.14 and later).
+"""
+import gzip
+import lzma
+import numpy as np
+
+# Magic bytes at the start of each supported format. gzip includes its
+# compression method byte (deflate) so raw records are not mistaken for it.
+_MAGIC = {
+    b'\x1f\x8b\x08': 'gzip',
+    b'\xfd7zXZ\x00': 'xz',
+    b'\x28\xb5\x2f\xfd': 'zstd',
+}
+
+# Number of records decompressed at a time
+COMPRESSED_CHUNK_SIZE = 4_096
+
+def detect_compression(filename:str):
+    """Detects the compression of a file from its magic bytes
+
+    Args:
+        filename (str): the path to a file
+
+    Returns:
+        str: 'gzip', 'xz', 'zstd' or None for an uncompressed file
+    """
+    with open(filename, 'rb') as file:
+        start = file.read(6)
+
+    for magic, compression in _MAGIC.items():
+        if start.startswith(magic):
+            return compression
+
+    return None
+
+def open_compressed(filename:str, compression:str = None):
+    """Opens a decompressing binary stream over a file
+
+    Args:
+        filename (str): the path to a compressed file
+        compression (str, optional): 'gzip', 'xz' or 'zstd', detected
+            from the file if None
+
+    Returns:
+        file object: readable binary stream of decompressed bytes
+    """
+    compression = compression or detect_compression(filename)
+
+    if compression == 'gzip':
+        return gzip.open(filename, 'rb')
+
+    elif compression == 'xz':
+        return lzma.open(filename, 'rb')
+
+    elif compression == 'zstd':
+        try:
+            from compression import zstd
+            return zstd.open(filename, 'rb')
+        except ImportError:
+            pass
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(f"Reading zstandard-compressed files requires the 'zstandard' package: {filename}")
+        return zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), closefd=True)
+
+    else:
+        raise ValueError(f"compression can be 'gzip', 'xz' or 'zstd' but not {compression}")
+
+class CompressedRecordStream:
+    """
+    Class to decompress fixed-width records from a compressed file into a
+    reusable buffer, keeping track of the decompressed position.
+    """
+    def __init__(self, filename:str, rectype, chunk_size:int = COMPRESSED_CHUNK_SIZE):
+        self.filename = filename
+        self.compression = detect_compression(filename)
+        self.rectype = np.dtype(rectype)
+
+        # Records are decompressed straight into this buffer
+        self.buffer = np.empty(chunk_size, dtype=self.rectype)
+        self._bytes = memoryview(self.buffer.view(np.uint8))
+
+        self.stream = None
+        self.position = 0
+        self._open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # (Re)open the stream at the first decompressed byte
+    def _open(self):
+        self.close()
+        self.stream = open_compressed(self.filename, self.compression)
+        self.position = 0
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def _fill(self, nbytes:int):
+        """Decompresses up to nbytes into the buffer
+
+        Returns:
+            int: number of bytes decompressed, less than nbytes at end of file
+        """
+        filled = 0
+        while filled < nbytes:
+            n = self.stream.readinto(self._bytes[filled:nbytes])
+            if not n:
+                break
+            filled += n
+        self.position += filled
+        return filled
+
+    def seek(self, offset:int):
+        """Moves to a decompressed byte offset. Streams cannot seek, so moving
+           forward decompresses and discards the bytes in between and moving
+           backward restarts from the beginning of the file.
+
+        Args:
+            offset (int): number of decompressed bytes from the start
+        """
+        if offset < self.position:
+            self._open()
+
+        while self.position < offset:
+            if self._fill(min(offset - self.position, len(self._bytes))) == 0:
+                break
+
+    def read_chunk(self, count:int = None):
+        """Decompresses the next records into the buffer
+
+        Args:
+            count (int, optional): maximum number of records, the buffer
+                size if None
+
+        Returns:
+            numpy structured array: view of the buffer, valid until the next
+            call. Empty at end of file.
+        """
+        count = len(self.buffer) if count is None or count < 0 else min(count, len(self.buffer))
+        itemsize = self.rectype.itemsize
+
+        filled = self._fill(count * itemsize)
+
+        # A trailing partial record is dropped
+        nrec = filled // itemsize
+        return self.buffer[:nrec]
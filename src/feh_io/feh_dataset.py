@@ -0,0 +1,261 @@
+"""
+Class defining a logical dataset over many DYNASIM-FEH runs.
+
+DYNASIM runs are stored in directories such as
+
+    run-1006-baseline/base-v8/dynasipp_header_even.dat
+    run-1006-baseline/base-v8/dynasipp_person_even.dat
+    run-1006-baseline/base-v8/dynasipp_family_even.dat
+
+FehDataset discovers every header under a root directory and pairs it with
+its person and family files. Each data file becomes one partition tagged
+with its scenario (first directory below the root), run (remaining
+directories) and parity ('even', 'odd' or '' for starting samples).
+Reads, filters and aggregations are run over the partitions on a worker
+pool and results are returned lazily as partitions finish.
+"""
+from feh_io.read_feh import get_rec_dtype, select_vars, read_records
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import namedtuple
+import itertools
+import os
+import re
+
+# Header files look like dynasipp_header_even.dat or dynasipp_HEADER.dat
+_HEADER_RE = re.compile(r'^(?P<prefix>.+)_header(?:_(?P<parity>even|odd))?\.dat$', re.IGNORECASE)
+
+# Data files may be stored raw or compressed, see compression.py
+_DATA_EXTENSIONS = ['', '.gz', '.xz', '.zst']
+
+FehPartition = namedtuple('FehPartition',
+                          ['scenario', 'run', 'parity', 'file_type', 'header_file', 'data_file'])
+
+def discover_partitions(root:str):
+    """Finds all DYNASIM header files under root and pairs them with data files
+
+    Args:
+        root (str): directory containing DYNASIM run directories
+
+    Returns:
+        list: FehPartition tuples, one per person or family data file
+    """
+    if not os.path.isdir(root):
+        raise FileNotFoundError(f"Dataset root is not a directory: {root}")
+
+    partitions = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        # Match data files regardless of case, e.g. dynasipp_PERSON.dat
+        lower_names = {name.lower(): name for name in filenames}
+
+        for name in sorted(filenames):
+            m = _HEADER_RE.match(name)
+            if m is None:
+                continue
+
+            rel = os.path.relpath(dirpath, root)
+            parts = [os.path.basename(os.path.abspath(root))] if rel == '.' else rel.split(os.sep)
+            suffix = f"_{m.group('parity')}" if m.group('parity') else ''
+
+            for file_type in ['person', 'family']:
+                data_names = [f"{m.group('prefix')}_{file_type}{suffix}.dat{ext}".lower()
+                              for ext in _DATA_EXTENSIONS]
+                data_name = next((name for name in data_names if name in lower_names), None)
+                if data_name is not None:
+                    partitions.append(FehPartition(
+                        scenario = parts[0],
+                        run = '/'.join(parts[1:]),
+                        parity = (m.group('parity') or '').lower(),
+                        file_type = file_type,
+                        header_file = os.path.join(dirpath, name),
+                        data_file = os.path.join(dirpath, lower_names[data_name])))
+
+    return partitions
+
+def _run_partition(partition, rectype, var_list, where, func):
+    """Reads one partition and applies a filter and a function to it.
+       Defined at module level so that it can be sent to worker processes.
+
+    Args:
+        partition (FehPartition): partition to read
+        rectype (dtype): record dtype of the partition
+        var_list (list): variables to keep, all if None
+        where (callable): function returning a boolean mask, or None
+        func (callable): function applied to the data, or None
+
+    Returns:
+        tuple: (partition, result)
+    """
+    # Filters may use any variable, so select variables while reading only without one
+    data = read_records(partition.data_file, rectype, var_list if where is None else None)
+
+    if where is not None:
+        data = data[where(data)]
+
+        if var_list is not None:
+            data = select_vars(data, var_list)
+
+    if func is not None:
+        data = func(data)
+
+    return partition, data
+
+def _bounded_imap(executor, fn, args_iter, window:int):
+    """Submits tasks to executor keeping at most window of them active
+
+    Args:
+        executor (Executor): a concurrent.futures executor
+        fn (callable): task function
+        args_iter (iterable): tuples of arguments for fn
+        window (int): maximum number of submitted, unfinished tasks
+
+    Yields:
+        results of fn in completion order
+    """
+    args_iter = iter(args_iter)
+    pending = {executor.submit(fn, *args) for args in itertools.islice(args_iter, window)}
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        # Keep the pool busy before handing results back
+        for args in itertools.islice(args_iter, len(done)):
+            pending.add(executor.submit(fn, *args))
+        for future in done:
+            yield future.result()
+
+class FehDataset:
+    """
+    Class representing many DYNASIM run directories as one logical dataset.
+    Nothing is read until a partition is processed, and at most max_workers
+    partitions are loaded at any time.
+    """
+    def __init__(self, root:str = None, partitions:list = None, max_workers:int = None, use_threads:bool = False):
+        # Partitions are either given or discovered under root
+        if partitions is None:
+            partitions = discover_partitions(root)
+        self.root = root
+        self.partitions = list(partitions)
+
+        # Worker pool settings. Functions must be picklable unless threads are used.
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.use_threads = use_threads
+
+        # One cached schema per header file and file type
+        self._schemas = {}
+
+    def __len__(self):
+        return len(self.partitions)
+
+    def __repr__(self):
+        return f"FehDataset(root={self.root!r}, partitions={len(self.partitions)})"
+
+    @property
+    def scenarios(self):
+        return sorted(set(p.scenario for p in self.partitions))
+
+    @property
+    def runs(self):
+        return sorted(set((p.scenario, p.run) for p in self.partitions))
+
+    # Get the record dtype of a partition, parsing each header only once
+    def schema(self, partition:FehPartition):
+        key = (partition.header_file, partition.file_type)
+        if key not in self._schemas:
+            self._schemas[key] = get_rec_dtype(partition.header_file, partition.file_type)
+        return self._schemas[key]
+
+    # Create a dataset over a subset of partitions, sharing the schema cache
+    def subset(self, file_type:str = None, scenarios:list = None, runs:list = None, parity:str = None):
+        """Selects partitions by their tags
+
+        Args:
+            file_type (str, optional): 'person' or 'family'
+            scenarios (list, optional): scenario names to keep
+            runs (list, optional): run names to keep
+            parity (str, optional): 'even', 'odd' or ''
+
+        Returns:
+            FehDataset: dataset over the selected partitions
+        """
+        if file_type is not None and file_type not in ['person', 'family']:
+            raise ValueError(f"file_type can be 'person' or 'family' but not {file_type}")
+
+        partitions = [p for p in self.partitions
+                      if (file_type is None or p.file_type == file_type)
+                      and (scenarios is None or p.scenario in scenarios)
+                      and (runs is None or p.run in runs)
+                      and (parity is None or p.parity == parity)]
+
+        dataset = FehDataset(root=self.root, partitions=partitions,
+                             max_workers=self.max_workers, use_threads=self.use_threads)
+        dataset._schemas = self._schemas
+        return dataset
+
+    def imap(self, func=None, file_type:str = 'person', var_list:list = None, where=None):
+        """Applies a function to every partition on the worker pool
+
+        Args:
+            func (callable, optional): function applied to each partition's
+                data, the data itself is returned if None
+            file_type (str): 'person' or 'family' partitions. Defaults to
+                'person'.
+            var_list (list, optional): variables to keep, all if None
+            where (callable, optional): function taking the data and
+                returning a boolean mask of records to keep
+
+        Yields:
+            tuple: (partition, result) in the order partitions finish
+        """
+        partitions = self.subset(file_type=file_type).partitions
+        tasks = ((p, self.schema(p), var_list, where, func) for p in partitions)
+
+        pool = ThreadPoolExecutor if self.use_threads else ProcessPoolExecutor
+        with pool(max_workers=self.max_workers) as executor:
+            yield from _bounded_imap(executor, _run_partition, tasks, self.max_workers)
+
+    def read(self, file_type:str = 'person', var_list:list = None, where=None):
+        """Reads all partitions into one dataframe tagged with scenario, run and parity
+
+        Args:
+            file_type (str): 'person' or 'family' partitions. Defaults to
+                'person'.
+            var_list (list, optional): variables to keep, all if None
+            where (callable, optional): function taking the data and
+                returning a boolean mask of records to keep
+
+        Returns:
+            pd.DataFrame: data from all partitions
+        """
+        import pandas as pd
+
+        frames = [pd.DataFrame(data).assign(scenario=p.scenario, run=p.run, parity=p.parity)
+                  for p, data in self.imap(None, file_type, var_list, where)]
+
+        # No matching partitions: an empty frame that still has the tag columns
+        if not frames:
+            return pd.DataFrame(columns=list(var_list or []) + ['scenario', 'run', 'parity'])
+
+        return pd.concat(frames, ignore_index=True)
+
+    def aggregate(self, func, combine=None, file_type:str = 'person', var_list:list = None, where=None):
+        """Computes a per-partition aggregate on the worker pool
+
+        Args:
+            func (callable): function reducing a partition's data
+            combine (callable, optional): function reducing the dict of
+                per-partition results to a single result
+            file_type (str): 'person' or 'family' partitions. Defaults to
+                'person'.
+            var_list (list, optional): variables to keep, all if None
+            where (callable, optional): function taking the data and
+                returning a boolean mask of records to keep
+
+        Returns:
+            dict|object: results keyed by partition, or combine(results)
+        """
+        results = dict(self.imap(func, file_type, var_list, where))
+
+        # Keep partition order stable regardless of completion order
+        results = {p: results[p] for p in self.subset(file_type=file_type).partitions}
+
+        return results if combine is None else combine(results)
@@ -0,0 +1,374 @@
+"""
+Class defining a lazy query over a DYNASIM-FEH data file.
+
+A FehFrame records a plan instead of reading data:
+
+    frame = (FehFrame(header_file, person_file)
+             .select('PERNUM', 'EARNINGS')
+             .where('AGE', '>=', 18)
+             .years(2006, 2030)
+             .to_long()
+             .agg({'earnings': 'sum'}, by=['year']))
+
+collect() and sink_parquet() then run the whole plan in one pass over a
+memory-mapped data file, chunk by chunk. Filters only touch the columns
+they test, and only the selected columns of the kept records are copied,
+so no full-width intermediate array is ever built.
+"""
+from feh_io.read_feh import get_record_dict, make_rec_dtype, get_mts_years, compare_values, COMPARISON_OPS
+from feh_io.compression import detect_compression
+import copy
+import os
+import numpy as np
+
+# Number of records processed at a time
+FRAME_CHUNK_SIZE = 65_536
+
+# Aggregations accepted by FehFrame.agg, all computed from mergeable partials
+_AGG_FUNCS = ['sum', 'count', 'min', 'max', 'mean']
+
+def _merge_partials(keys, counts, stats:dict):
+    """Merges rows of partial aggregates that share a group key
+
+    Args:
+        keys (np.array): structured array with the key of each row, or None
+            when all rows are one group
+        counts (np.array): int64 number of records of each row
+        stats (dict): {column: (sums, mins, maxs)} int64 arrays, one value per row
+
+    Returns:
+        tuple: (keys, counts, stats) with one row per group, sorted by key
+    """
+    if keys is None:
+        ngroups, inverse = 1, np.zeros(len(counts), dtype=np.intp)
+    else:
+        keys, inverse = np.unique(keys, return_inverse=True)
+        ngroups, inverse = len(keys), inverse.ravel()
+
+    group_counts = np.zeros(ngroups, dtype=np.int64)
+    np.add.at(group_counts, inverse, counts)
+
+    merged = {}
+    for col, (sums, mins, maxs) in stats.items():
+        group_sums = np.zeros(ngroups, dtype=np.int64)
+        group_mins = np.full(ngroups, np.iinfo(np.int64).max)
+        group_maxs = np.full(ngroups, np.iinfo(np.int64).min)
+        np.add.at(group_sums, inverse, sums)
+        np.minimum.at(group_mins, inverse, mins)
+        np.maximum.at(group_maxs, inverse, maxs)
+        merged[col] = (group_sums, group_mins, group_maxs)
+
+    return keys, group_counts, merged
+
+class FehFrame:
+    """
+    Class holding a lazy query plan over one DYNASIM data file.
+    Every method except collect() and sink_parquet() returns a new FehFrame.
+    """
+    def __init__(self, header_file:str, data_file:str, file_type:str = 'person', chunk_size:int = FRAME_CHUNK_SIZE):
+        if not os.path.exists(data_file):
+            raise FileNotFoundError(f"File path for data is not correctly specified: {data_file}")
+        if detect_compression(data_file) is not None:
+            raise ValueError(f"Memory-mapped reads need an uncompressed data file: {data_file}")
+
+        self.header_file = header_file
+        self.data_file = data_file
+        self.file_type = file_type
+        self.chunk_size = chunk_size
+
+        # Schema is read once from the header
+        rec = get_record_dict(header_file, file_type)
+        self.rectype = make_rec_dtype(rec)
+        self.mts_years = get_mts_years(rec)
+
+        # The plan
+        self._columns = None
+        self._predicates = []
+        self._year_window = None
+        self._long = False
+        self._agg = None
+
+    def __repr__(self):
+        steps = [f"scan({os.path.basename(self.data_file)!r})"]
+        if self._predicates:
+            steps.append(f"where({len(self._predicates)} predicates)")
+        if self._columns is not None:
+            steps.append(f"select({', '.join(self._columns)})")
+        if self._year_window is not None:
+            steps.append(f"years{self._year_window}")
+        if self._long:
+            steps.append("to_long()")
+        if self._agg is not None:
+            steps.append(f"agg({self._agg[0]}, by={self._agg[1]})")
+        return "FehFrame: " + " -> ".join(steps)
+
+    # Copy the plan so that every step returns a new frame
+    def _extend(self):
+        if self._agg is not None:
+            raise ValueError("agg() must be the last step of a FehFrame plan")
+        frame = copy.copy(self)
+        frame._predicates = list(self._predicates)
+        return frame
+
+    def select(self, *columns):
+        """Keeps only the given columns. MTS variable names (e.g. 'EARNINGS')
+           select their whole series.
+
+        Returns:
+            FehFrame: frame with the selection added to the plan
+        """
+        missing_vars = [c for c in columns if c not in self.rectype.names and c not in self.mts_years]
+        if missing_vars:
+            raise ValueError(f"Fields missing from the data:\n{missing_vars}\n"
+                             f"\nAvailable variables are:\n{self.rectype.names}")
+        frame = self._extend()
+        frame._columns = list(columns)
+        return frame
+
+    def where(self, column, op:str = None, value = None):
+        """Keeps only records matching a condition. Conditions are tested on
+           the full record, so they may use columns that are not selected.
+
+        Args:
+            column (str|callable): column to test, or a function taking a
+                chunk of records and returning a boolean mask
+            op (str): one of '==', '!=', '<', '<=', '>', '>=', 'in'
+            value: value to compare the column with
+
+        Returns:
+            FehFrame: frame with the condition added to the plan
+        """
+        if not callable(column):
+            if column not in self.rectype.names:
+                raise ValueError(f"Field missing from the data: {column}")
+            if op not in COMPARISON_OPS:
+                raise ValueError(f"op can be one of {list(COMPARISON_OPS)} but not {op}")
+        frame = self._extend()
+        frame._predicates.append((column, op, value))
+        return frame
+
+    def years(self, first:int = None, last:int = None):
+        """Keeps only MTS years in [first, last]
+
+        Returns:
+            FehFrame: frame with the year window added to the plan
+        """
+        frame = self._extend()
+        frame._year_window = (first, last)
+        return frame
+
+    def to_long(self):
+        """Reshapes MTS variables to long format with one row per record and year.
+           Columns are lower case, as in feh_wide_to_long. Raises a ValueError
+           if the plan has no MTS variable, or none with years in the window.
+
+        Returns:
+            FehFrame: frame with the reshape added to the plan
+        """
+        frame = self._extend()
+        frame._long = True
+        frame._resolve_columns()
+        return frame
+
+    def agg(self, aggs:dict, by:list = None):
+        """Aggregates output columns, optionally by groups
+
+        Args:
+            aggs (dict): {column: function or list of functions}, functions
+                being 'sum', 'count', 'min', 'max' or 'mean'
+            by (list, optional): output columns to group by
+
+        Returns:
+            FehFrame: frame with the aggregation added to the plan
+        """
+        aggs = {col: [funcs] if isinstance(funcs, str) else list(funcs) for col, funcs in aggs.items()}
+        bad_funcs = [f for funcs in aggs.values() for f in funcs if f not in _AGG_FUNCS]
+        if bad_funcs:
+            raise ValueError(f"Aggregations can be {_AGG_FUNCS} but not {bad_funcs}")
+
+        # Aggregated and grouping columns refer to the output of the plan so far
+        scalars, mts, years = self._resolve_columns()
+        outtype = self._output_dtype(scalars, mts)
+        missing_vars = [c for c in list(aggs) + list(by or []) if c not in outtype.names]
+        if missing_vars:
+            raise ValueError(f"Fields missing from the data:\n{missing_vars}\n"
+                             f"\nAvailable variables are:\n{outtype.names}")
+
+        frame = self._extend()
+        frame._agg = (aggs, list(by or []))
+        return frame
+
+    def _resolve_columns(self):
+        """Works out which fields the plan outputs
+
+        Returns:
+            tuple: (scalar fields, {MTS name: [(year, field)]}, sorted years)
+        """
+        columns = self._columns
+        if columns is None:
+            # Scalars plus every MTS series, each year field only once
+            columns = [n for n in self.rectype.names
+                       if n not in self.mts_years and not self._is_mts_field(n)]
+            columns += list(self.mts_years)
+
+        first, last = self._year_window or (None, None)
+        scalars, mts = [], {}
+        for name in columns:
+            if name in self.mts_years:
+                ly, hy = self.mts_years[name]
+                ly = ly if first is None else max(ly, first)
+                hy = hy if last is None else min(hy, last)
+                mts[name] = [(y, f"{name}{y}") for y in range(ly, hy + 1)]
+            else:
+                scalars.append(name)
+
+        years = sorted(set(y for fields in mts.values() for y, _ in fields))
+        if self._long and not years:
+            raise ValueError(f"to_long() needs MTS variables with years in the plan, "
+                             f"but the plan outputs only {scalars}")
+        return scalars, mts, years
+
+    # Check whether a field is one year of an MTS variable
+    def _is_mts_field(self, name):
+        stub, year = name[:-4], name[-4:]
+        if stub not in self.mts_years or not year.isdigit():
+            return False
+        ly, hy = self.mts_years[stub]
+        return ly <= int(year) <= hy
+
+    def _output_dtype(self, scalars, mts):
+        if self._long:
+            names = ['year'] + [n.lower() for n in scalars] + [n.lower() for n in mts]
+        else:
+            names = scalars + [f for fields in mts.values() for _, f in fields]
+        return np.dtype({'names': names, 'formats': ['i4']*len(names)})
+
+    def _mask(self, chunk):
+        mask = None
+        for column, op, value in self._predicates:
+            m = column(chunk) if callable(column) else compare_values(chunk[column], op, value)
+            mask = m if mask is None else mask & m
+        return mask
+
+    def _iter_chunks(self):
+        """Runs select, where, years and to_long over the file, one chunk at a time
+
+        Yields:
+            numpy structured array: output records of one chunk
+        """
+        scalars, mts, years = self._resolve_columns()
+        outtype = self._output_dtype(scalars, mts)
+
+        nrec = os.path.getsize(self.data_file) // self.rectype.itemsize
+        if nrec == 0:
+            return
+        records = np.memmap(self.data_file, dtype=self.rectype, mode='r', shape=(nrec,))
+
+        for lo in range(0, nrec, self.chunk_size):
+            chunk = records[lo:lo + self.chunk_size]
+
+            # Evaluate conditions on the columns they use only
+            mask = self._mask(chunk)
+            idx = None if mask is None else np.flatnonzero(mask)
+            n = len(chunk) if idx is None else len(idx)
+
+            # Copy a column of the kept records
+            def take(field):
+                return chunk[field] if idx is None else chunk[field][idx]
+
+            if not self._long:
+                out = np.empty(n, dtype=outtype)
+                for name in outtype.names:
+                    out[name] = take(name)
+
+            else:
+                # One row per record and year, records in file order
+                nyears = len(years)
+                year_pos = {y: i for i, y in enumerate(years)}
+                out = np.zeros(n * nyears, dtype=outtype)
+                out['year'] = np.tile(np.array(years, dtype='i4'), n)
+                for name in scalars:
+                    out[name.lower()] = np.repeat(take(name), nyears)
+                for name, fields in mts.items():
+                    block = out[name.lower()].reshape(n, nyears)
+                    for y, field in fields:
+                        block[:, year_pos[y]] = take(field)
+
+            yield out
+
+    def _aggregate(self, chunks):
+        """Reduces output chunks to one record per group. Each chunk is reduced
+           to per-group partials, and the partials of all chunks are merged
+           the same way, so sums and counts stay exact int64 throughout."""
+        aggs, by = self._agg
+
+        partials = []
+        for out in chunks:
+            if len(out) == 0:
+                continue
+            values = {col: out[col].astype(np.int64) for col in aggs}
+            partials.append(_merge_partials(out[by] if by else None, np.ones(len(out), dtype=np.int64),
+                                            {col: (v, v, v) for col, v in values.items()}))
+
+        names = list(by) + [f"{col}_{f}" for col, funcs in aggs.items() for f in funcs]
+        formats = ['i4']*len(by) + ['f8' if f == 'mean' else 'i8' for funcs in aggs.values() for f in funcs]
+        if not partials:
+            return np.zeros(0, dtype={'names': names, 'formats': formats})
+
+        keys, counts, stats = _merge_partials(
+            np.concatenate([p[0] for p in partials]) if by else None,
+            np.concatenate([p[1] for p in partials]),
+            {col: tuple(np.concatenate([p[2][col][i] for p in partials]) for i in range(3)) for col in aggs})
+
+        result = np.zeros(len(counts), dtype={'names': names, 'formats': formats})
+        for name in by:
+            result[name] = keys[name]
+        for col, funcs in aggs.items():
+            sums, mins, maxs = stats[col]
+            columns = {'sum': sums, 'count': counts, 'min': mins, 'max': maxs, 'mean': sums / counts}
+            for f in funcs:
+                result[f"{col}_{f}"] = columns[f]
+
+        return result
+
+    def collect(self):
+        """Runs the plan
+
+        Returns:
+            numpy structured array: data
+        """
+        if self._agg is not None:
+            return self._aggregate(self._iter_chunks())
+
+        scalars, mts, years = self._resolve_columns()
+        chunks = list(self._iter_chunks())
+        if not chunks:
+            return np.empty(0, dtype=self._output_dtype(scalars, mts))
+        return np.concatenate(chunks)
+
+    def sink_parquet(self, file_path:str):
+        """Runs the plan and streams the result to a parquet file
+
+        Args:
+            file_path (str): path of the parquet file to write
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        chunks = [self.collect()] if self._agg is not None else self._iter_chunks()
+
+        writer = None
+        for out in chunks:
+            table = pa.Table.from_arrays([pa.array(out[name]) for name in out.dtype.names],
+                                         names=list(out.dtype.names))
+            if writer is None:
+                writer = pq.ParquetWriter(file_path, table.schema)
+            writer.write_table(table)
+
+        if writer is None:
+            scalars, mts, years = self._resolve_columns()
+            outtype = self._output_dtype(scalars, mts)
+            schema = pa.schema([pa.field(name, pa.from_numpy_dtype(outtype[name])) for name in outtype.names])
+            writer = pq.ParquetWriter(file_path, schema)
+        writer.close()
+        print(f"Saved data as parquet to {file_path}")
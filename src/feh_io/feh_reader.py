@@ -11,15 +11,36 @@ DYNASIM FEH produces three files:
 read_feh and save_feh modules define functionality for accessing, processing, and writing files.
 This module defines classes that can be used to edit those functionalities.
 """
-from feh_io.read_feh import read_feh_data_file, read_header_file, make_rec_dtype, select_vars
+from feh_io.read_feh import read_feh_data_file, read_header_file, make_rec_dtype, select_vars, convert_output, get_rec_dtype, read_stream_records
+from feh_io.compression import detect_compression, CompressedRecordStream
 import os
+import threading
 import numpy as np
 
+# Check if file paths to headers and data exist
+def check_file_paths(header_file:str, data_file:str):
+    if not os.path.exists(data_file):
+        raise FileNotFoundError(f"File path for data is not correctly specified: {data_file}")
+    elif not os.path.exists(header_file):
+        raise FileNotFoundError(f"File path for header is not correctly specified: {header_file}")
+
+# Check if file type is correctly specified
+def check_file_type(file_type:str):
+    if file_type not in ['person', 'family']:
+        raise ValueError(f"Invalid file type: {file_type}."
+                         f"Must be input as '{'person'}' or '{'family'}'.")
+
+# Check if output format is correctly specified
+def check_output(output:str):
+    if output not in ['numpy', 'pandas', 'arrow']:
+        raise ValueError(f"Invalid output: {output}. "
+                         f"Must be input as 'numpy', 'pandas' or 'arrow'.")
+
 class FehReader:
     """
     Class to read a file in chunks, keeping track of the offset between calls.
     """
-    def __init__(self, header_file:str, data_file:str, file_type:str, chunk_size:int=-1, var_list:list=None):
+    def __init__(self, header_file:str, data_file:str, file_type:str, chunk_size:int=-1, var_list:list=None, output:str='numpy'):
         # Initialize file held as empty. File is opened/closed when read is called.
         self.file_size = os.path.getsize(data_file)
         self.data_file = data_file
@@ -31,22 +52,30 @@ class FehReader:
         self.var_list = var_list
         self.bytes_read = 0
 
+        # Format returned by read_chunk: 'numpy', 'pandas' or 'arrow'
+        self.output = output
+
+        # Compressed files are read through one stream kept open between chunks
+        self.compression = None
+        self._stream = None
+
         # Check if file paths to headers and data exist, check file type initialization
         self.check_file_paths()
         self.check_file_type()
+        self.check_output()
+        self.compression = detect_compression(data_file)
 
     # Check if file paths to headers and data exist
     def check_file_paths(self):
-        if not os.path.exists(self.data_file):
-            raise FileNotFoundError(f"File path for data is not correctly specified: {self.data_file}")
-        elif not os.path.exists(self.header_file):
-            raise FileNotFoundError(f"File path for header is not correctly specified: {self.data_file}")
-    
+        check_file_paths(self.header_file, self.data_file)
+
     # Check if file type is correctly specified
     def check_file_type(self):
-        if self.file_type not in ['person', 'family']:
-            raise ValueError(f"Invalid file type: {self.file_type}." 
-                             f"Must be input as '{'person'}' or '{'family'}'.")
+        check_file_type(self.file_type)
+
+    # Check if output format is correctly specified
+    def check_output(self):
+        check_output(self.output)
 
     # Reset the bytes read in
     def reset_data(self):
@@ -64,9 +93,30 @@ class FehReader:
         self.var_list = var_list
         self.reset_data()
     
+    # Close the decompression stream of a compressed file, if open
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    # Read the next chunk of a compressed file, continuing the open stream
+    def read_compressed_chunk(self):
+        if self._stream is None:
+            self._stream = CompressedRecordStream(self.data_file, get_rec_dtype(self.header_file, self.file_type))
+
+        # Forward from the current position, or restart after a reset
+        self._stream.seek(self.bytes_read)
+        file = read_stream_records(self._stream, self.var_list, self.chunk_size)
+        self.bytes_read += len(file) * self._stream.rectype.itemsize
+
+        return convert_output(file, self.output)
+
     # Read data file
     def read_chunk(self):
 
+        if self.compression is not None:
+            return self.read_compressed_chunk()
+
         # Read in data file, get bytes read in
         file = read_feh_data_file( header_file = self.header_file, 
                                         data_file = self.data_file,
@@ -82,4 +132,109 @@ class FehReader:
         if self.var_list is not None:
             file = select_vars(file, self.var_list)
 
-        return file
\ No newline at end of file
+        return convert_output(file, self.output)
+
+class ConcurrentFehReader:
+    """
+    Class to read ranges of records from many threads at once.
+    The header is parsed once and the data file is opened once; every read
+    uses positioned I/O (os.preadv) on the shared descriptor, so there is no
+    cursor to share and the GIL is released while reading. close() waits
+    for reads in progress to finish, and reads started after it fail.
+    """
+    def __init__(self, header_file:str, data_file:str, file_type:str = 'person', output:str = 'numpy'):
+        self.header_file = header_file
+        self.data_file = data_file
+        self.file_type = file_type
+        self.output = output
+
+        check_file_paths(header_file, data_file)
+        check_file_type(file_type)
+        check_output(output)
+        if detect_compression(data_file) is not None:
+            raise ValueError(f"Positioned reads need an uncompressed data file: {data_file}")
+
+        self.rectype = get_rec_dtype(header_file, file_type)
+        self.fd = os.open(data_file, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        self.nrec = os.fstat(self.fd).st_size // self.rectype.itemsize
+
+        # Platforms without pread share one cursor, guarded by this lock
+        self._lock = threading.Lock()
+
+        # Number of reads using the descriptor, so close() cannot free it under them
+        self._readers = threading.Condition()
+        self._active = 0
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.nrec
+
+    def close(self):
+        """Rejects new reads, waits for those in progress, then closes the file"""
+        with self._readers:
+            if self._closed:
+                return
+            self._closed = True
+            self._readers.wait_for(lambda: self._active == 0)
+            os.close(self.fd)
+            self.fd = None
+
+    def _read_into(self, buffer, offset:int):
+        """Fills buffer with the bytes of the data file starting at offset"""
+        view = memoryview(buffer)
+        done = 0
+        while done < len(view):
+            if hasattr(os, 'preadv'):
+                n = os.preadv(self.fd, [view[done:]], offset + done)
+            elif hasattr(os, 'pread'):
+                chunk = os.pread(self.fd, len(view) - done, offset + done)
+                view[done:done + len(chunk)] = chunk
+                n = len(chunk)
+            else:
+                with self._lock:
+                    os.lseek(self.fd, offset + done, os.SEEK_SET)
+                    n = os.readv(self.fd, [view[done:]])
+            if n == 0:
+                raise EOFError(f"{self.data_file} ended at byte {offset + done}")
+            done += n
+
+    def read_rows(self, start:int, stop:int = None, var_list:list = None):
+        """Reads records start to stop (exclusive), as a slice would
+
+        Args:
+            start (int): index of the first record
+            stop (int, optional): index after the last record, the end of
+                the file if None or past it
+            var_list (list, optional): variables to keep, all if None
+
+        Returns:
+            numpy structured array|pd.DataFrame|pa.Table: data
+        """
+        stop = self.nrec if stop is None else min(stop, self.nrec)
+        if start < 0 or start > stop:
+            raise IndexError(f"Records {start} to {stop} are out of range 0 to {self.nrec}")
+
+        with self._readers:
+            if self._closed:
+                raise ValueError(f"Reader of {self.data_file} is closed")
+            self._active += 1
+        try:
+            data = np.empty(stop - start, dtype=self.rectype)
+            if len(data):
+                self._read_into(data.view(np.uint8), start * self.rectype.itemsize)
+        finally:
+            with self._readers:
+                self._active -= 1
+                if self._active == 0:
+                    self._readers.notify_all()
+
+        if var_list is not None:
+            data = select_vars(data, var_list)
+
+        return convert_output(data, self.output)
@@ -0,0 +1,170 @@
+"""
+Functions for computing over DYNASIM-FEH MTS variables.
+
+An MTS variable such as EARNINGS is stored as one i4 field per year
+(EARNINGS1951, ..., EARNINGS2087), and the fields of one variable are
+contiguous in the record. mts_matrix views them as a (records x years)
+matrix without copying, and the kernels below compute row-wise over that
+matrix, one value per person:
+
+    earnings = mts_matrix(data, 'EARNINGS', years=(1951, 2010))
+    aime = top_n_mean(earnings, 35)
+    first_year = first_nonzero_year(earnings, 1951)
+"""
+from feh_io.read_feh import compare_values, COMPARISON_OPS
+import re
+import numpy as np
+
+def mts_field_years(data, var:str):
+    """Lists the years of an MTS variable present in a structured array
+
+    Args:
+        data (np.array): structured numpy array
+        var (str): MTS variable name, e.g. 'EARNINGS'
+
+    Returns:
+        list: years in field order
+    """
+    pattern = re.compile(rf"{re.escape(var)}(\d{{4}})")
+    years = [int(m.group(1)) for m in map(pattern.fullmatch, data.dtype.names) if m]
+
+    if not years:
+        raise ValueError(f"Fields missing from the data:\n{[var]}\n"
+                         f"\nAvailable variables are:\n{data.dtype.names}")
+    return years
+
+def mts_matrix(data, var:str, years = None):
+    """Views the yearly fields of an MTS variable as a 2-D matrix.
+       When the fields are contiguous and share one type, as in records read
+       from a DYNASIM file, the matrix is a strided view of data and writing
+       to it writes to data. Otherwise the fields are copied.
+
+    Args:
+        data (np.array): structured numpy array
+        var (str): MTS variable name, e.g. 'EARNINGS'
+        years (tuple|range, optional): (first, last) years, inclusive, or a
+            range of consecutive years. All years in data if None.
+
+    Returns:
+        np.array: matrix of shape (records, years)
+    """
+    available = mts_field_years(data, var)
+
+    if years is None:
+        first, last = min(available), max(available)
+    elif isinstance(years, range):
+        first, last = years.start, years.stop - 1
+    else:
+        first, last = years
+
+    fields = [f"{var}{year}" for year in range(first, last + 1)]
+    missing_vars = [field for field in fields if field not in data.dtype.names]
+    if missing_vars:
+        raise ValueError(f"Fields missing from the data:\n{missing_vars}\n"
+                         f"\nAvailable variables are:\n{data.dtype.names}")
+
+    # Fields must be evenly spaced by their own size to be viewed as a matrix
+    ftype, offset = data.dtype.fields[fields[0]][:2]
+    contiguous = all(data.dtype.fields[field][:2] == (ftype, offset + i*ftype.itemsize)
+                     for i, field in enumerate(fields))
+
+    if not contiguous:
+        return np.stack([data[field] for field in fields], axis=1)
+
+    column = data[fields[0]]
+    return np.lib.stride_tricks.as_strided(
+        column, shape=(len(data), len(fields)), strides=(column.strides[0], ftype.itemsize),
+        writeable=column.flags.writeable)
+
+def cumulative_sum(matrix):
+    """Running total over years of each row, as int64"""
+    return np.cumsum(matrix, axis=1, dtype=np.int64)
+
+def lifetime_sum(matrix):
+    """Total over years of each row, as int64"""
+    return matrix.sum(axis=1, dtype=np.int64)
+
+def top_n_mean(matrix, n:int):
+    """Mean of the n highest years of each row, e.g. 35 for the AIME.
+       Rows are divided by n even if they have fewer than n years.
+
+    Args:
+        matrix (np.array): matrix of shape (records, years)
+        n (int): number of years to average
+
+    Returns:
+        np.array: float64 means
+    """
+    if n < 1:
+        raise ValueError(f"n must be at least 1 but not {n}")
+
+    nyears = matrix.shape[1]
+    if n >= nyears:
+        return lifetime_sum(matrix) / n
+
+    # Partition moves the n largest values of each row to its end
+    top = np.partition(matrix, nyears - n, axis=1)[:, nyears - n:]
+    return top.sum(axis=1, dtype=np.int64) / n
+
+def _year_labels(matrix, years):
+    """Years of the matrix columns from the first year or a list of years"""
+    if np.isscalar(years):
+        return np.arange(years, years + matrix.shape[1])
+    years = np.asarray(years)
+    if len(years) != matrix.shape[1]:
+        raise ValueError(f"years has {len(years)} values but the matrix has {matrix.shape[1]} columns")
+    return years
+
+def first_nonzero_year(matrix, years, missing:int = -1):
+    """First year with a nonzero value in each row
+
+    Args:
+        matrix (np.array): matrix of shape (records, years)
+        years (int|list): year of the first column, or the year of each column
+        missing (int, optional): value for rows that are all zero
+
+    Returns:
+        np.array: years
+    """
+    labels = _year_labels(matrix, years)
+    nonzero = matrix != 0
+    first = labels[np.argmax(nonzero, axis=1)]
+    return np.where(nonzero.any(axis=1), first, missing)
+
+def last_nonzero_year(matrix, years, missing:int = -1):
+    """Last year with a nonzero value in each row
+
+    Args:
+        matrix (np.array): matrix of shape (records, years)
+        years (int|list): year of the first column, or the year of each column
+        missing (int, optional): value for rows that are all zero
+
+    Returns:
+        np.array: years
+    """
+    labels = _year_labels(matrix, years)
+    nonzero = matrix[:, ::-1] != 0
+    last = labels[::-1][np.argmax(nonzero, axis=1)]
+    return np.where(nonzero.any(axis=1), last, missing)
+
+def count_years(matrix, condition, value = None):
+    """Number of years in each row that meet a condition
+
+    Args:
+        matrix (np.array): matrix of shape (records, years)
+        condition (str|callable): comparison operator ('==', '!=', '<', '<=',
+            '>', '>=') applied with value, or a function of the matrix that
+            returns a boolean matrix
+        value (optional): value compared against
+
+    Returns:
+        np.array: counts
+    """
+    if callable(condition):
+        mask = condition(matrix)
+    elif condition in COMPARISON_OPS:
+        mask = compare_values(matrix, condition, value)
+    else:
+        raise ValueError(f"condition can be one of {list(COMPARISON_OPS)} or a function but not {condition}")
+
+    return np.count_nonzero(mask, axis=1)
@@ -11,16 +11,19 @@ DYNASIM FEH produces three files:
 The header file contains specifications of both family and person
 records. The function that reads DYNASIM data is read_feh_data_file. 
 It requires paths to a header file and to one of the two data files.
+
+pandas and pyarrow are imported by the functions that use them, so reading
+headers and binary records does not pay their import cost.
 """
 
+import operator
+import os
 import struct
+import sys
 import numpy as np
-import pandas as pd
 import io
 import numpy.lib.recfunctions as rf
-import pyarrow.parquet as pq # for parquet file format
-import pyarrow as pa # for pyarrow functions format
-import pandas as pd
+from feh_io.compression import detect_compression, CompressedRecordStream
 
 def make_record_dict(file:io.BufferedReader, sample:str):
     """Reads a section of a header file and creates a record dictionary
@@ -181,6 +184,56 @@ def read_header_file(filename:str):
 
     return year, famrec, perrec
 
+def get_record_dict(header_file:str, file_type:str = 'person'):
+    """Reads a DYNASIM header file and returns the dictionary of one record type
+
+    Args:
+        header_file (str): the path to a DYNASIM header file
+        file_type (str): 'person' or 'family' file. Defaults to 
+            'person'.
+
+    Returns:
+        dict: record dictionary, see make_record_dict
+    """
+
+    # Initialize family and person dictionaries and numeric year
+    year, famrec, perrec = read_header_file(header_file)
+    
+    if file_type == 'person':
+        return perrec
+
+    elif file_type == 'family':
+        return famrec
+
+    else:
+        raise ValueError(f"file_type can be 'person' or 'family' but not {file_type}")
+
+def get_rec_dtype(header_file:str, file_type:str = 'person'):
+    """Reads a DYNASIM header file and creates the dtype of one record type
+
+    Args:
+        header_file (str): the path to a DYNASIM header file
+        file_type (str): 'person' or 'family' file. Defaults to 
+            'person'.
+
+    Returns:
+        dtype: A dtype object for a numpy structured array
+    """
+
+    return make_rec_dtype(get_record_dict(header_file, file_type))
+
+def get_mts_years(rec:dict):
+    """Lists the MTS variables of a record and their year ranges
+
+    Args:
+        rec (dict): a dictionary that describes a record
+
+    Returns:
+        dict: {MTS variable name: (first year, last year)}
+    """
+    return {rec['names'][rec['mtsnm'][i]].strip(): (rec['mtsly'][i], rec['mtshy'][i])
+            for i in range(rec['nmts'])}
+
 def select_vars(data, var_list:list):
     """Selects a var from a structured array and repacks array
        Repacking removes unnecessary padding bytes.
@@ -206,13 +259,225 @@ def select_vars(data, var_list:list):
     
     return data
 
+def read_records(data_file:str, rectype, var_list:list = None, count:int = -1, offset:int = 0):
+    """Reads records from a raw or compressed (gzip, xz, zstd) DYNASIM data file.
+       Compressed files are decompressed chunk by chunk into a reusable
+       buffer and variables are selected from each chunk, so only the
+       selected data is held in memory.
+
+    Args:
+        data_file (str): the path to a DYNASIM data file
+        rectype (dtype): record dtype, see make_rec_dtype
+        var_list (list, optional): variables to keep, all if None
+        count (int, optional): number of records to read, all if -1. 
+            Defaults to -1.
+        offset (int, optional): number of (decompressed) bytes to skip
+            before reading. Defaults to 0.
+
+    Returns:
+        numpy structured array: data
+    """
+    if detect_compression(data_file) is None:
+        data = np.fromfile(data_file, dtype=rectype, count=count, offset=offset)
+        return data if var_list is None else select_vars(data, var_list)
+
+    with CompressedRecordStream(data_file, rectype) as stream:
+        stream.seek(offset)
+        return read_stream_records(stream, var_list, count)
+
+def read_record_fields(data_file:str, rectype, var_list:list, start:int, stop:int):
+    """Copies some fields of records start to stop (exclusive) of an
+       uncompressed data file. The file is memory-mapped, so only the
+       selected fields are copied into memory, not the whole records.
+
+    Args:
+        data_file (str): the path to an uncompressed DYNASIM data file
+        rectype (dtype): record dtype, see make_rec_dtype
+        var_list (list): variables to copy
+        start (int): index of the first record
+        stop (int): index after the last record
+
+    Returns:
+        numpy structured array: data with the fields of var_list only
+    """
+    if stop <= start:
+        return select_vars(np.empty(0, dtype=rectype), var_list)
+
+    records = np.memmap(data_file, dtype=rectype, mode='r', offset=start * rectype.itemsize, shape=(stop - start,))
+    data = select_vars(records, var_list)
+
+    # Selecting every field in order repacks nothing and leaves a view of the map
+    if np.may_share_memory(data, records):
+        data = data.copy()
+    return np.asarray(data)
+
+def read_stream_records(stream, var_list:list = None, count:int = -1):
+    """Reads records from an open CompressedRecordStream at its current position
+
+    Args:
+        stream (CompressedRecordStream): stream of decompressed records
+        var_list (list, optional): variables to keep, all if None
+        count (int, optional): number of records to read, all if -1. 
+            Defaults to -1.
+
+    Returns:
+        numpy structured array: data
+    """
+    chunks = []
+    remaining = count
+    while remaining != 0:
+        chunk = stream.read_chunk(remaining)
+        if len(chunk) == 0:
+            break
+        # Copy out of the reusable buffer
+        chunks.append(chunk.copy() if var_list is None else select_vars(chunk, var_list))
+        if remaining > 0:
+            remaining -= len(chunk)
+
+    if not chunks:
+        data = np.empty(0, dtype=stream.rectype)
+        return data if var_list is None else select_vars(data, var_list)
+
+    return np.concatenate(chunks)
+
+# Comparison operators accepted by compare_values
+COMPARISON_OPS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<':  operator.lt,
+    '<=': operator.le,
+    '>':  operator.gt,
+    '>=': operator.ge,
+    'in': np.isin,
+}
+
+def compare_values(values, op:str, value):
+    """Compares values elementwise, e.g. compare_values(data['AGE'], '>=', 18)
+
+    Args:
+        values (np.array): values to test
+        op (str): one of '==', '!=', '<', '<=', '>', '>=', 'in'
+        value: value to compare with, a list for 'in'
+
+    Returns:
+        np.array: boolean mask
+    """
+    if op not in COMPARISON_OPS:
+        raise ValueError(f"op can be one of {list(COMPARISON_OPS)} but not {op}")
+    return COMPARISON_OPS[op](values, value)
+
+def iter_record_chunks(data_file:str, rectype, chunk_records:int):
+    """Reads a raw or compressed data file sequentially, chunk_records at a time
+
+    Args:
+        data_file (str): the path to a DYNASIM data file
+        rectype (dtype): record dtype, see make_rec_dtype
+        chunk_records (int): number of records in each chunk
+
+    Yields:
+        numpy structured array: records of one chunk
+    """
+    if detect_compression(data_file) is not None:
+        with CompressedRecordStream(data_file, rectype, chunk_size=chunk_records) as stream:
+            while True:
+                chunk = stream.read_chunk()
+                if len(chunk) == 0:
+                    return
+                yield chunk
+    else:
+        with open(data_file, 'rb') as file:
+            while True:
+                chunk = np.fromfile(file, dtype=rectype, count=chunk_records)
+                if len(chunk) == 0:
+                    return
+                yield chunk
+
+def count_records(data_file:str, rectype):
+    """Counts the records of a raw or compressed data file.
+       Compressed files are decompressed in one streaming pass.
+
+    Args:
+        data_file (str): the path to a DYNASIM data file
+        rectype (dtype): record dtype, see make_rec_dtype
+
+    Returns:
+        int: number of records
+    """
+    if detect_compression(data_file) is None:
+        return os.path.getsize(data_file) // rectype.itemsize
+
+    with CompressedRecordStream(data_file, rectype) as stream:
+        nrec = 0
+        while True:
+            n = len(stream.read_chunk())
+            if n == 0:
+                return nrec
+            nrec += n
+
+def as_int32_block(data):
+    """Views a structured array whose fields are all packed i4 as a 2-D array.
+       No data is copied.
+
+    Args:
+        data (np.array): structured numpy array
+
+    Returns:
+        np.array: int32 array of shape (records, fields), or None if the
+        fields are not all packed i4
+    """
+    fields = [data.dtype.fields[name] for name in data.dtype.names]
+    packed = all(ft == np.dtype('i4') and off == 4*i for i, (ft, off) in enumerate(fields))
+
+    if not packed or data.dtype.itemsize != 4*len(fields) or not data.flags['C_CONTIGUOUS']:
+        return None
+
+    return data.view(np.int32).reshape(len(data), len(fields))
+
+def convert_output(data, output:str = 'numpy'):
+    """Converts a structured array read from a DYNASIM file to the requested output.
+       When every field is i4 the record buffer is viewed as one 2-D int32
+       block: pandas wraps it without copying and arrow needs a single
+       transposition for all columns.
+
+    Args:
+        data (np.array): structured numpy array
+        output (str): 'numpy', 'pandas' or 'arrow'. Defaults to 'numpy'.
+
+    Returns:
+        numpy structured array|pd.DataFrame|pa.Table: data
+    """
+    if output == 'numpy':
+        return data
+
+    if output not in ['pandas', 'arrow']:
+        raise ValueError(f"output can be 'numpy', 'pandas' or 'arrow' but not {output}")
+
+    names = list(data.dtype.names)
+    block = as_int32_block(data)
+
+    if output == 'pandas':
+        import pandas as pd
+        if block is None:
+            return pd.DataFrame(data)
+        return pd.DataFrame(block, columns=names, copy=False)
+
+    import pyarrow as pa
+
+    if block is None:
+        return pa.Table.from_arrays([pa.array(data[name]) for name in names], names=names)
+
+    # One transposition makes every column contiguous; arrow wraps each without copying
+    columns = np.ascontiguousarray(block.T)
+    return pa.Table.from_arrays([pa.array(column) for column in columns], names=names)
+
 def read_feh_data_file(
         header_file:str, 
         data_file:str,
         var_list:list = None,
         file_type:str = 'person', 
         count:int = -1,
-        offset:int = 0):
+        offset:int = 0,
+        output:str = 'numpy'):
     """Reads a DYNASIM data file
 
     Args:
@@ -222,32 +487,24 @@ def read_feh_data_file(
             'person'.
         count (int, optional): number of records to read, all if -1. 
             Defaults to -1.
-        offset (int, optional): number of bytes to skip before reading.
+        offset (int, optional): number of bytes to skip before reading,
+            counted in decompressed bytes for compressed files.
             Defaults to 0.
+        output (str, optional): 'numpy' for a structured array, 'pandas'
+            for a DataFrame or 'arrow' for a pyarrow Table. Defaults to
+            'numpy'.
 
     Returns:
-        numpy structured array: data
+        numpy structured array|pd.DataFrame|pa.Table: data
     """
 
-    # Initialize family and person dictionaries and numeric year
-    year, famrec, perrec = read_header_file(header_file)
+    # Build the record dtype from the header
+    rectype = get_rec_dtype(header_file, file_type)
     
-    if file_type == 'person':
-        rectype = make_rec_dtype(perrec)
-
-    elif file_type == 'family':
-        rectype = make_rec_dtype(famrec)
-
-    else:
-        raise ValueError(f"file_type can be 'person' or 'family' but not {file_type}")
+    # Read raw or compressed records, selecting variables in varlist, if provided
+    data = read_records(data_file, rectype, var_list, count, offset)
     
-    data = np.fromfile(data_file, dtype=rectype, count=count, offset=offset)
-
-    # Change name to reflect names in varlist, if provided
-    if var_list is not None:
-        data = select_vars(data, var_list)
-    
-    return data
+    return convert_output(data, output)
 
 def feh_wide_to_long(data):
     """Converts wide DYNASIM data to a long format
@@ -259,7 +516,10 @@ def feh_wide_to_long(data):
         structured numpy array|pd.DataFrame: long-format data with longitudinal variables from data
     """
 
-    if isinstance(data, pd.DataFrame):
+    # A DataFrame can only exist if pandas has been imported
+    pd = sys.modules.get('pandas')
+
+    if pd is not None and isinstance(data, pd.DataFrame):
         return __feh_wide_to_long_pd(data)
     else:
         return __feh_wide_to_long_numpy(data)
@@ -274,6 +534,8 @@ def __feh_wide_to_long_pd(df):
     Returns:
         pd.DataFrame: long-format dataframe with longitudinal variables from df
     """
+    import pandas as pd
+
     mtswide = [x for x in df.columns if x[-4:].isdigit()]
     stubnames = list(set([x[:-4] for x in  mtswide]))
     
@@ -348,6 +610,43 @@ def structured_shape(x):
     else:
         return x.shape
 
+def load_feh_arrow(file_path:str, var_list:list = None, output:str = 'arrow'):
+    """Loads an Arrow IPC file written by save_feh_arrow.
+       The file is memory-mapped: columns of an uncompressed file are views
+       of the OS page cache, so loading takes no time and processes that load
+       the same file share its memory. LZ4 files are decompressed on load.
+
+    Args:
+        file_path (str): path of the .arrow file
+        var_list (list, optional): variables to keep, all if None
+        output (str, optional): 'arrow' for a pyarrow Table or 'numpy' for
+            a dict of {variable: numpy array}. Defaults to 'arrow'.
+
+    Returns:
+        pa.Table|dict: data
+    """
+    import pyarrow as pa
+
+    if output not in ['arrow', 'numpy']:
+        raise ValueError(f"output can be 'arrow' or 'numpy' but not {output}")
+
+    with pa.memory_map(file_path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+
+    if var_list is not None:
+        missing_vars = [var for var in var_list if var not in table.column_names]
+        if missing_vars:
+            raise ValueError(f"Fields missing from the data:\n{missing_vars}\n"
+                             f"\nAvailable variables are:\n{tuple(table.column_names)}")
+        table = table.select(var_list)
+
+    if output == 'arrow':
+        return table
+
+    # Single-chunk columns without nulls convert without copying
+    return {name: column.chunk(0).to_numpy() if column.num_chunks == 1 else column.to_numpy()
+            for name, column in zip(table.column_names, table.columns)}
+
 # Attempt 1- read parquet file then convert to structured numpy array
 def read_parquet_1(file_path:str):
     """Reads a parquet-format array created by save_feh_parquet() 
@@ -359,6 +658,9 @@ def read_parquet_1(file_path:str):
     Returns:
         structured numpy array: data 
     """
+    import pyarrow.parquet as pq # for parquet file format
+    import pyarrow as pa # for pyarrow functions format
+
     # Step 1: Read the Parquet file into a PyArrow Table
     table_test = pq.read_table(file_path)
 
@@ -406,6 +708,8 @@ def read_parquet_2(file_path):
     Returns:
         structured numpy array: data 
     """
+    import pyarrow.parquet as pq # for parquet file format
+
     # Step 1: Read the Parquet file into a pandas DataFrame
     df = pq.read_table(file_path).to_pandas()
 
@@ -0,0 +1,118 @@
+"""
+Functions for sampling records from DYNASIM-FEH data files.
+
+DYNASIM records have a fixed width, so the position of any record in a
+data file is known from its index. sample_feh memory-maps a data file and
+reads only the sampled records, in file order, without scanning the rest.
+"""
+from feh_io.read_feh import get_rec_dtype, select_vars, convert_output
+from feh_io.compression import detect_compression
+import os
+import numpy as np
+
+# Number of records read at a time when scanning the stratification column
+STRATA_CHUNK_SIZE = 65_536
+
+def _sample_size(n:int, frac:float, total:int):
+    """Number of records to draw from a group of total records"""
+    size = n if n is not None else int(round(frac * total))
+    return min(size, total)
+
+def read_strata(records, stratify_by:str, strata_fn = None, chunk_size:int = STRATA_CHUNK_SIZE):
+    """Reads the stratification column of memory-mapped records in chunks
+
+    Args:
+        records (np.memmap): memory-mapped structured array
+        stratify_by (str): name of the stratification column
+        strata_fn (callable, optional): function mapping column values to
+            strata, e.g. ages to birth cohorts
+        chunk_size (int, optional): number of records read at a time
+
+    Returns:
+        np.array: one stratum label per record
+    """
+    if stratify_by not in records.dtype.names:
+        raise ValueError(f"Field missing from the data: {stratify_by}")
+
+    labels = np.empty(len(records), dtype=records.dtype[stratify_by])
+    for lo in range(0, len(records), chunk_size):
+        labels[lo:lo + chunk_size] = records[stratify_by][lo:lo + chunk_size]
+
+    return labels if strata_fn is None else np.asarray(strata_fn(labels))
+
+def sample_feh(
+        header_file:str,
+        data_file:str,
+        n:int = None,
+        frac:float = None,
+        seed:int = None,
+        stratify_by:str = None,
+        strata_fn = None,
+        var_list:list = None,
+        file_type:str = 'person',
+        output:str = 'numpy'):
+    """Draws a random sample of records from a DYNASIM data file without
+       replacement. Only the sampled records are read; a stratified sample
+       also reads the stratification column first.
+
+    Args:
+        header_file (str): the path to a DYNASIM header file
+        data_file (str): the path to a DYNASIM data file
+        n (int, optional): number of records to draw, per stratum if
+            stratify_by is given
+        frac (float, optional): fraction of records to draw, per stratum
+            if stratify_by is given
+        seed (int, optional): seed of the random generator, the same seed
+            draws the same records
+        stratify_by (str, optional): column whose values define strata
+        strata_fn (callable, optional): function mapping stratify_by
+            values to strata, e.g. lambda age: (2006 - age) // 10
+        var_list (list, optional): variables to keep, all if None
+        file_type (str): 'person' or 'family' file. Defaults to 'person'.
+        output (str, optional): 'numpy', 'pandas' or 'arrow'. Defaults to
+            'numpy'.
+
+    Returns:
+        numpy structured array|pd.DataFrame|pa.Table: sampled records in
+        file order
+    """
+    if (n is None) == (frac is None):
+        raise ValueError("Exactly one of n and frac must be given")
+    if frac is not None and not 0 <= frac <= 1:
+        raise ValueError(f"frac must be between 0 and 1 but not {frac}")
+
+    if detect_compression(data_file) is not None:
+        raise ValueError(f"Memory-mapped reads need an uncompressed data file: {data_file}")
+
+    rectype = get_rec_dtype(header_file, file_type)
+    nrec = os.path.getsize(data_file) // rectype.itemsize
+    rng = np.random.default_rng(seed)
+
+    if nrec == 0:
+        data = np.empty(0, dtype=rectype)
+        return convert_output(data if var_list is None else select_vars(data, var_list), output)
+
+    records = np.memmap(data_file, dtype=rectype, mode='r', shape=(nrec,))
+
+    if stratify_by is None:
+        idx = rng.choice(nrec, size=_sample_size(n, frac, nrec), replace=False)
+
+    else:
+        labels = read_strata(records, stratify_by, strata_fn)
+
+        # Group record indices by stratum, each group in file order
+        strata, inverse = np.unique(labels, return_inverse=True)
+        order = np.argsort(inverse.ravel(), kind='stable')
+        bounds = np.cumsum(np.bincount(inverse.ravel(), minlength=len(strata)))[:-1]
+
+        idx = np.concatenate([
+            rng.choice(members, size=_sample_size(n, frac, len(members)), replace=False)
+            for members in np.split(order, bounds)])
+
+    # Sorted positions keep reads moving forward through the file
+    data = records[np.sort(idx)]
+
+    if var_list is not None:
+        data = select_vars(data, var_list)
+
+    return convert_output(np.asarray(data), output)
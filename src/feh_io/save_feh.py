@@ -17,6 +17,11 @@ import os
 import numpy.lib.recfunctions as rf
 import pyarrow.parquet as pq # for parquet file format
 import pyarrow as pa # for pyarrow functions format
+from feh_io.feh_reader import FehReader
+from feh_io.read_feh import select_vars, convert_output
+
+# Number of records converted at a time by convert_feh_parquet
+CONVERT_CHUNK_SIZE = 50_000
 
 def save_feh_parquet(data, out_path:str, filename:str):
     """Saves a structured numpy array to a .dat file
@@ -57,4 +62,183 @@ def save_feh_parquet(data, out_path:str, filename:str):
     pq.write_table(pa_table, file_path)
     print(f"Saved data as parquet to {file_path}")
 
-    return
\ No newline at end of file
+    return
+
+def save_feh_arrow(data, out_path:str, filename:str, compression:str = None):
+    """Saves data to an Arrow IPC (Feather v2) file that load_feh_arrow can
+       memory-map. The data is written as one record batch, so an
+       uncompressed file reloads as a single zero-copy view of each column.
+
+    Args:
+        data (np.array|pd.DataFrame|pa.Table): structured numpy array, dataframe or table
+        out_path (str): path to save the data ex. save
+        filename (str): name of the file to save the data as
+        compression (str, optional): None for an uncompressed, memory-mappable
+            file or 'lz4' for a smaller file that is decompressed on load
+
+    Returns:
+        str: path of the .arrow file
+    """
+    if compression not in [None, 'lz4']:
+        raise ValueError(f"compression can be None or 'lz4' but not {compression}")
+
+    file_path = os.path.join(out_path, f"{filename}.arrow")
+
+    # Convert structured arrays and dataframes to one contiguous table
+    if isinstance(data, np.ndarray):
+        table = convert_output(data, 'arrow')
+    elif isinstance(data, pa.Table):
+        table = data
+    else:
+        table = pa.Table.from_pandas(data, preserve_index=False)
+    table = table.combine_chunks()
+
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    tmp_path = f"{file_path}.tmp-{os.getpid()}"
+    try:
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table, max_chunksize=max(1, table.num_rows))
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return file_path
+
+def convert_feh_parquet(header_file:str, data_file:str, file_path:str, file_type:str = 'person',
+                        var_list:list = None, chunk_size:int = CONVERT_CHUNK_SIZE):
+    """Converts a DYNASIM data file to parquet, one chunk of records at a time.
+       The file is written under a temporary name and renamed when complete,
+       so file_path never holds a partial conversion.
+
+    Args:
+        header_file (str): the path to a DYNASIM header file
+        data_file (str): the path to a DYNASIM data file
+        file_path (str): path of the parquet file to write
+        file_type (str): 'person' or 'family' file. Defaults to 'person'.
+        var_list (list, optional): variables to keep, all if None
+        chunk_size (int, optional): number of records read at a time
+
+    Returns:
+        int: number of records written
+    """
+    reader = FehReader(header_file, data_file, file_type, chunk_size=chunk_size,
+                       var_list=var_list, output='arrow')
+    tmp_path = f"{file_path}.tmp-{os.getpid()}"
+    nrec = 0
+    writer = None
+
+    try:
+        while True:
+            table = reader.read_chunk()
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            if table.num_rows == 0:
+                break
+            writer.write_table(table)
+            nrec += table.num_rows
+        writer.close()
+        os.replace(tmp_path, file_path)
+
+    finally:
+        reader.close()
+        if os.path.exists(tmp_path):
+            if writer is not None:
+                writer.close()
+            os.remove(tmp_path)
+
+    return nrec
+
+def save_feh_parquet_dataset(header_file:str, data_file:str, out_dir:str, partition_by,
+                             file_type:str = 'person', var_list:list = None, sort_by:list = None,
+                             chunk_size:int = CONVERT_CHUNK_SIZE):
+    """Converts a DYNASIM data file to a hive-partitioned parquet dataset
+       (out_dir/SEGTYPE=1/..., out_dir/BIRTH_DECADE=1960/...), so that
+       pyarrow.dataset or DuckDB only read the partitions a query filters on.
+       Records are streamed one chunk at a time. Each chunk is sorted by its
+       partition keys and then by sort_by, so every row group holds a sorted
+       run of one partition and its min/max statistics stay narrow.
+
+       Partitions present in out_dir from an earlier conversion are replaced.
+
+    Args:
+        header_file (str): the path to a DYNASIM header file
+        data_file (str): the path to a DYNASIM data file
+        out_dir (str): directory of the dataset
+        partition_by (str|list|dict): scalar fields to partition by, or a
+            dict of {partition column: field name or function}. A function
+            is given each chunk as a structured array and returns one value
+            per record, e.g. {'BIRTH_DECADE': lambda d: (2006 - d['AGE']) // 10 * 10}.
+        file_type (str): 'person' or 'family' file. Defaults to 'person'.
+        var_list (list, optional): variables to keep, all if None. Fields
+            used by partition_by and sort_by are read even if not kept.
+        sort_by (str|list, optional): fields to sort by within partitions
+        chunk_size (int, optional): number of records read at a time
+
+    Returns:
+        int: number of records written
+    """
+    import pyarrow.dataset as ds
+
+    if isinstance(partition_by, str):
+        partition_by = [partition_by]
+    if not isinstance(partition_by, dict):
+        partition_by = {name: name for name in partition_by}
+    sort_by = [] if sort_by is None else [sort_by] if isinstance(sort_by, str) else list(sort_by)
+
+    # Fields needed to build partitions and order records, besides var_list
+    extra_vars = [field for field in list(partition_by.values()) + sort_by if isinstance(field, str)]
+    read_vars = None if var_list is None else list(dict.fromkeys(var_list + extra_vars))
+
+    reader = FehReader(header_file, data_file, file_type, chunk_size=chunk_size, var_list=read_vars)
+    nrec = 0
+
+    def batches(first):
+        nonlocal nrec
+        chunk = first
+        while len(chunk) > 0:
+            parts = {name: np.asarray(chunk[field] if isinstance(field, str) else field(chunk))
+                     for name, field in partition_by.items()}
+
+            # np.lexsort sorts by its last key first
+            keys = [chunk[field] for field in reversed(sort_by)] + list(reversed(list(parts.values())))
+            order = np.lexsort(keys)
+
+            kept = chunk if var_list is None else select_vars(chunk, var_list)
+            table = convert_output(kept[order], 'arrow')
+            for name, values in parts.items():
+                # Partition columns replace fields of the same name
+                if name in table.column_names:
+                    table = table.drop_columns([name])
+                table = table.append_column(name, pa.array(values[order]))
+
+            nrec += table.num_rows
+            yield from table.to_batches()
+            chunk = reader.read_chunk()
+
+    try:
+        first = reader.read_chunk()
+        if len(first) == 0:
+            return 0
+
+        # The schema comes from the first batch, so it is built before streaming
+        batch_iter = batches(first)
+        head = next(batch_iter)
+
+        def all_batches():
+            yield head
+            yield from batch_iter
+
+        ds.write_dataset(
+            pa.RecordBatchReader.from_batches(head.schema, all_batches()),
+            out_dir,
+            format='parquet',
+            partitioning=list(partition_by),
+            partitioning_flavor='hive',
+            basename_template='part-{i}.parquet',
+            existing_data_behavior='delete_matching')
+
+    finally:
+        reader.close()
+
+    return nrec
@@ -0,0 +1,261 @@
+"""
+Class defining a deduplicated store of DYNASIM-FEH scenario runs.
+
+Reform runs share most of their records with the baseline: the same people
+have the same histories for most variables. ScenarioStore keeps one
+baseline as a column store and every other run as the blocks of columns
+that differ from it:
+
+    store_dir/
+        manifest.json           header hash, variables, record count,
+                                block size and runs
+        header.dat              copy of the DYNASIM header
+        baseline.dat            int32 column store, one column after another
+        baseline-hashes.npy     hash of every (block, column) of the baseline
+        runs/NAME.dat           changed blocks of run NAME, one after another
+        runs/NAME-blocks.npy    (column, block, hash) of each changed block
+
+Each column is cut into blocks of block_records records and every block
+carries a blake2b hash. A run block is stored only if its hash differs
+from the baseline block. Reading a run memory-maps the baseline, copies the
+projected columns and overlays their changed blocks.
+
+    store = ScenarioStore.create('store', header_file, baseline_person_file)
+    store.add_run('reform-1', reform_person_file)
+    data = store.read('reform-1', var_list=['PERNUM', 'EARNINGS2030'])
+"""
+from feh_io.read_feh import get_rec_dtype, select_vars, convert_output, as_int32_block, iter_record_chunks, count_records
+import hashlib
+import json
+import os
+import re
+import shutil
+import numpy as np
+
+MANIFEST_NAME = 'manifest.json'
+
+# Default number of records in a block of one column
+STORE_BLOCK_RECORDS = 65_536
+
+# Index of the changed blocks of a run, in the order they are stored.
+# Hashes are void rather than bytes, which would drop trailing zero bytes.
+BLOCK_INDEX_DTYPE = np.dtype([('column', 'i4'), ('block', 'i4'), ('hash', 'V16')])
+
+def hash_block(values):
+    """Hashes the bytes of one column block"""
+    return hashlib.blake2b(np.ascontiguousarray(values).tobytes(), digest_size=16).digest()
+
+def _write_json(obj:dict, path:str):
+    """Writes json under a temporary name and renames it into place"""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as file:
+        json.dump(obj, file, indent=2)
+    os.replace(tmp_path, path)
+
+def _iter_column_blocks(data_file:str, rectype, block_records:int):
+    """Yields each block of records as an int32 (columns x records) array"""
+    for chunk in iter_record_chunks(data_file, rectype, block_records):
+        block = as_int32_block(chunk)
+        if block is None:
+            raise ValueError(f"Only records of packed i4 fields can be stored, not {rectype}")
+        yield np.ascontiguousarray(block.T)
+
+class ScenarioStore:
+    """
+    Class holding a baseline run and reform runs stored as changed blocks.
+    """
+    def __init__(self, store_dir:str):
+        self.store_dir = store_dir
+        manifest_path = os.path.join(store_dir, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"Not a scenario store, {MANIFEST_NAME} is missing: {store_dir}")
+
+        with open(manifest_path, 'r') as file:
+            self.manifest = json.load(file)
+
+        self.file_type = self.manifest['file_type']
+        self.names = tuple(self.manifest['names'])
+        self.nrec = self.manifest['nrec']
+        self.block_records = self.manifest['block_records']
+        self.header_file = os.path.join(store_dir, 'header.dat')
+        self.rectype = get_rec_dtype(self.header_file, self.file_type)
+
+        if self.nrec == 0:
+            # Empty files cannot be memory-mapped
+            self.baseline = np.empty((len(self.names), 0), dtype=np.int32)
+        else:
+            self.baseline = np.memmap(os.path.join(store_dir, 'baseline.dat'), dtype=np.int32, mode='r',
+                                      shape=(len(self.names), self.nrec))
+        self.baseline_hashes = np.load(os.path.join(store_dir, 'baseline-hashes.npy'))
+
+    def __repr__(self):
+        return f"ScenarioStore({self.store_dir!r}, records={self.nrec}, runs={self.runs})"
+
+    @property
+    def runs(self):
+        """Names of the stored runs, 'baseline' first"""
+        return ['baseline'] + list(self.manifest['runs'])
+
+    @classmethod
+    def create(cls, store_dir:str, header_file:str, data_file:str, file_type:str = 'person',
+               block_records:int = STORE_BLOCK_RECORDS):
+        """Creates a store whose baseline is a DYNASIM data file
+
+        Args:
+            store_dir (str): directory of the new store
+            header_file (str): the path to a DYNASIM header file
+            data_file (str): the path to a raw or compressed baseline data file
+            file_type (str): 'person' or 'family' file. Defaults to 'person'.
+            block_records (int, optional): number of records in a block
+
+        Returns:
+            ScenarioStore: the new store
+        """
+        rectype = get_rec_dtype(header_file, file_type)
+        nrec = count_records(data_file, rectype)
+        os.makedirs(os.path.join(store_dir, 'runs'), exist_ok=True)
+
+        shutil.copyfile(header_file, os.path.join(store_dir, 'header.dat'))
+        with open(header_file, 'rb') as file:
+            header_hash = hashlib.sha256(file.read()).hexdigest()
+
+        # Columns are filled one block of records at a time
+        names = rectype.names
+        path = os.path.join(store_dir, 'baseline.dat')
+        hashes = np.empty((-(-nrec // block_records), len(names)), dtype='V16')
+
+        if nrec == 0:
+            open(path, 'wb').close()
+        else:
+            baseline = np.memmap(path, dtype=np.int32, mode='w+', shape=(len(names), nrec))
+            for b, columns in enumerate(_iter_column_blocks(data_file, rectype, block_records)):
+                lo = b * block_records
+                baseline[:, lo:lo + columns.shape[1]] = columns
+                hashes[b] = [hash_block(column) for column in columns]
+            baseline.flush()
+            del baseline
+        np.save(os.path.join(store_dir, 'baseline-hashes.npy'), hashes)
+
+        manifest = {
+            'file_type': file_type,
+            'header_sha256': header_hash,
+            'names': list(names),
+            'nrec': nrec,
+            'block_records': block_records,
+            'runs': {},
+        }
+        _write_json(manifest, os.path.join(store_dir, MANIFEST_NAME))
+        return cls(store_dir)
+
+    def add_run(self, name:str, data_file:str):
+        """Stores a run as the blocks that differ from the baseline.
+           The run is read with the store's header and must have the same
+           number of records as the baseline.
+
+        Args:
+            name (str): name of the run, e.g. 'reform-1'
+            data_file (str): the path to a raw or compressed DYNASIM data file
+
+        Returns:
+            int: number of changed blocks stored
+        """
+        if not re.fullmatch(r'[\w.-]+', name) or name == 'baseline':
+            raise ValueError(f"name can contain letters, digits, '_', '.' and '-' and not be 'baseline', but not {name}")
+
+        path = os.path.join(self.store_dir, 'runs', f"{name}.dat")
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        index_path = os.path.join(self.store_dir, 'runs', f"{name}-blocks.npy")
+        blocks = []
+        lo = 0
+
+        try:
+            with open(tmp_path, 'wb') as out:
+                for b, columns in enumerate(_iter_column_blocks(data_file, self.rectype, self.block_records)):
+                    if lo + columns.shape[1] > self.nrec:
+                        raise ValueError(f"{data_file} has more records than the baseline ({self.nrec})")
+
+                    for c, column in enumerate(columns):
+                        digest = hash_block(column)
+                        if digest != self.baseline_hashes[b, c].tobytes():
+                            column.tofile(out)
+                            blocks.append((c, b, digest))
+                    lo += columns.shape[1]
+
+            if lo != self.nrec:
+                raise ValueError(f"{data_file} has {lo} records but the baseline has {self.nrec}")
+
+            np.save(index_path, np.array(blocks, dtype=BLOCK_INDEX_DTYPE))
+            os.replace(tmp_path, path)
+
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self.manifest['runs'][name] = {'source': os.path.abspath(data_file), 'changed_blocks': len(blocks)}
+        _write_json(self.manifest, os.path.join(self.store_dir, MANIFEST_NAME))
+        return len(blocks)
+
+    def run_blocks(self, run:str):
+        """Lists the (column, block, hash) of the blocks a run changes"""
+        if run == 'baseline':
+            return np.empty(0, dtype=BLOCK_INDEX_DTYPE)
+        return np.load(os.path.join(self.store_dir, 'runs', f"{run}-blocks.npy"))
+
+    def read_columns(self, run:str = 'baseline', var_list:list = None):
+        """Reads columns of a run as int32 arrays
+
+        Args:
+            run (str): name of the run. Defaults to 'baseline'.
+            var_list (list, optional): variables to read, all if None
+
+        Returns:
+            dict: {variable: np.array}
+        """
+        if run not in self.runs:
+            raise ValueError(f"run can be one of {self.runs} but not {run}")
+
+        var_list = list(self.names) if var_list is None else var_list
+        missing_vars = [var for var in var_list if var not in self.names]
+        if missing_vars:
+            raise ValueError(f"Fields missing from the data:\n{missing_vars}\n"
+                             f"\nAvailable variables are:\n{self.names}")
+
+        index = {name: i for i, name in enumerate(self.names)}
+        columns = {var: np.array(self.baseline[index[var]]) for var in var_list}
+        if run == 'baseline':
+            return columns
+
+        blocks = self.run_blocks(run)
+        if len(blocks) == 0:
+            return columns
+
+        # Changed blocks are stored in index order; the last block of a column may be short
+        lengths = np.minimum(self.block_records, self.nrec - blocks['block'].astype(np.int64) * self.block_records)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        deltas = np.memmap(os.path.join(self.store_dir, 'runs', f"{run}.dat"), dtype=np.int32, mode='r')
+
+        wanted = {index[var]: var for var in var_list}
+        for i in np.flatnonzero(np.isin(blocks['column'], list(wanted))):
+            lo = int(blocks['block'][i]) * self.block_records
+            columns[wanted[blocks['column'][i]]][lo:lo + lengths[i]] = deltas[offsets[i]:offsets[i + 1]]
+
+        return columns
+
+    def read(self, run:str = 'baseline', var_list:list = None, output:str = 'numpy'):
+        """Reads a run as records, as read_feh_data_file would read its data file
+
+        Args:
+            run (str): name of the run. Defaults to 'baseline'.
+            var_list (list, optional): variables to read, all if None
+            output (str, optional): 'numpy', 'pandas' or 'arrow'. Defaults to 'numpy'.
+
+        Returns:
+            numpy structured array|pd.DataFrame|pa.Table: data
+        """
+        columns = self.read_columns(run, var_list)
+        rectype = self.rectype if var_list is None else select_vars(np.empty(0, self.rectype), var_list).dtype
+
+        data = np.empty(self.nrec, dtype=rectype)
+        for var, values in columns.items():
+            data[var] = values
+        return convert_output(data, output)
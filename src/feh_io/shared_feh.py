@@ -0,0 +1,172 @@
+"""
+Class defining a DYNASIM-FEH dataset held in shared memory.
+
+Worker pools that all read the same data file would each hold their own
+copy of it. SharedFehArray reads a data file once, optionally keeping only
+some variables, into a named multiprocessing.shared_memory segment. Workers
+attach to the segment as a read-only numpy view using only its spec (name,
+dtype and number of records), so the data is held once for all of them.
+
+    with SharedFehArray.create(header_file, person_file, var_list=['PERNUM', 'AGE']) as shared:
+        pool.map(work, [shared.spec] * 32)
+
+    def work(spec):
+        data = SharedFehArray.attach(spec).array
+
+The creating process owns the segment and unlinks it when closed, when the
+object is garbage collected or when the interpreter exits.
+"""
+from feh_io.read_feh import get_rec_dtype, select_vars, iter_record_chunks, count_records, read_record_fields
+from feh_io.compression import detect_compression
+from multiprocessing import shared_memory, resource_tracker
+from collections import namedtuple
+import threading
+import weakref
+import numpy as np
+
+# Bytes of whole records copied into shared memory at a time
+SHARED_CHUNK_BYTES = 32 * 2**20
+
+# Guards the temporary replacement of resource_tracker.register
+_register_lock = threading.Lock()
+
+SharedFehSpec = namedtuple('SharedFehSpec', ['name', 'dtype', 'nrec'])
+
+def _attach_segment(name:str):
+    """Opens an existing segment without registering it for cleanup.
+       Only the owner may unlink it; a registered reader would remove the
+       segment when it exits."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no track argument
+        pass
+
+    # The replacement is process-wide, so threads attaching at once take turns.
+    # Threads creating segments meanwhile would go untracked; create before
+    # attaching from other threads.
+    with _register_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+def _release(shm, owner:bool):
+    """Closes a segment and unlinks it if owned. Used as a finalizer."""
+    try:
+        shm.close()
+    except BufferError:
+        # numpy views of the segment are still alive; the mapping goes with them
+        pass
+    if owner:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+class SharedFehArray:
+    """
+    Class holding a structured array of DYNASIM records in a named shared
+    memory segment. Use create() in the owning process and attach() in workers.
+    """
+    def __init__(self, shm, dtype, nrec:int, owner:bool):
+        self.shm = shm
+        self.dtype = np.dtype(dtype)
+        self.nrec = nrec
+        self.owner = owner
+
+        self.array = np.ndarray((nrec,), dtype=self.dtype, buffer=shm.buf)
+        if not owner:
+            self.array.flags.writeable = False
+
+        # Close (and unlink, for the owner) on close(), garbage collection or exit
+        self._finalizer = weakref.finalize(self, _release, shm, owner)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.nrec
+
+    def __repr__(self):
+        return f"SharedFehArray(name={self.shm.name!r}, nrec={self.nrec}, owner={self.owner})"
+
+    @property
+    def spec(self):
+        """Picklable description that workers pass to attach()"""
+        return SharedFehSpec(self.shm.name, self.dtype, self.nrec)
+
+    def close(self):
+        """Drops this process's view; the owner also unlinks the segment"""
+        self.array = None
+        self._finalizer()
+
+    @classmethod
+    def create(cls, header_file:str, data_file:str, file_type:str = 'person', var_list:list = None,
+               name:str = None, chunk_size:int = None):
+        """Reads a DYNASIM data file into a new shared memory segment.
+           Records are streamed into the segment chunk by chunk, so besides
+           the segment only one chunk is held in memory. Compressed files are
+           decompressed twice: once to count the records, once to copy them.
+
+        Args:
+            header_file (str): the path to a DYNASIM header file
+            data_file (str): the path to a raw or compressed DYNASIM data file
+            file_type (str): 'person' or 'family' file. Defaults to 'person'.
+            var_list (list, optional): variables to keep, all if None
+            name (str, optional): segment name, generated if None
+            chunk_size (int, optional): number of records copied at a time,
+                about SHARED_CHUNK_BYTES of records if None
+
+        Returns:
+            SharedFehArray: the owning handle
+        """
+        rectype = get_rec_dtype(header_file, file_type)
+        dtype = rectype if var_list is None else select_vars(np.empty(0, rectype), var_list).dtype
+
+        nrec = count_records(data_file, rectype)
+        chunk_size = chunk_size or max(1, SHARED_CHUNK_BYTES // rectype.itemsize)
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(1, nrec * dtype.itemsize))
+        try:
+            shared = cls(shm, dtype, nrec, owner=True)
+        except Exception:
+            _release(shm, owner=True)
+            raise
+
+        try:
+            if detect_compression(data_file) is None:
+                # Only the kept fields are copied out of the memory-mapped file
+                for lo in range(0, nrec, chunk_size):
+                    hi = min(lo + chunk_size, nrec)
+                    shared.array[lo:hi] = read_record_fields(data_file, rectype, list(dtype.names), lo, hi)
+            else:
+                lo = 0
+                for chunk in iter_record_chunks(data_file, rectype, chunk_size):
+                    if lo + len(chunk) > nrec:
+                        raise ValueError(f"{data_file} changed while it was read")
+                    shared.array[lo:lo + len(chunk)] = chunk if var_list is None else select_vars(chunk, var_list)
+                    lo += len(chunk)
+        except Exception:
+            shared.close()
+            raise
+
+        return shared
+
+    @classmethod
+    def attach(cls, spec):
+        """Attaches to a segment created by another process
+
+        Args:
+            spec (SharedFehSpec|tuple): (name, dtype, nrec) from the owner's spec
+
+        Returns:
+            SharedFehArray: handle with a read-only array view
+        """
+        name, dtype, nrec = spec
+        return cls(_attach_segment(name), dtype, nrec, owner=False)
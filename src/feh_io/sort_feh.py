@@ -0,0 +1,166 @@
+"""
+Functions for sorting DYNASIM-FEH data files larger than memory.
+
+sort_feh_file sorts the fixed-width records of a data file by one or more
+fields. Chunks that fit the memory budget are sorted in memory and spilled
+to disk as sorted runs, and the runs are then merged block by block. The
+records are moved as raw bytes, so the output is a regular DYNASIM data
+file that read_feh_data_file and FehReader can open with the same header.
+"""
+from feh_io.read_feh import get_rec_dtype, iter_record_chunks
+import os
+import tempfile
+import numpy as np
+
+# Default memory budget of a sort, in bytes
+SORT_MEMORY_BUDGET = 256 * 2**20
+
+def encode_sort_key(records, key:list):
+    """Encodes the key fields of records as one array that sorts in key order
+
+    Args:
+        records (np.array): structured array of records
+        key (list): names of the fields to sort by, most significant first
+
+    Returns:
+        np.array: int64 for one field, uint64 for two, bytes for more
+    """
+    if len(key) == 1:
+        return records[key[0]].astype(np.int64)
+
+    # Shift signed values to unsigned so that byte and bit order match value order
+    shifted = [(records[field].astype(np.int64) + 2**31).astype(np.uint64) for field in key]
+
+    if len(key) == 2:
+        return (shifted[0] << np.uint64(32)) | shifted[1]
+
+    block = np.empty((len(records), len(key)), dtype='>u4')
+    for i, values in enumerate(shifted):
+        block[:, i] = values
+    return block.view(f'S{4*len(key)}').ravel()
+
+def _write_sorted_runs(data_file:str, rectype, key:list, run_records:int, tmp_dir:str):
+    """Sorts chunks of run_records records and writes each to its own file
+
+    Returns:
+        list: (path, number of records) of each sorted run
+    """
+    runs = []
+    for i, chunk in enumerate(iter_record_chunks(data_file, rectype, run_records)):
+        order = np.argsort(encode_sort_key(chunk, key), kind='stable')
+        path = os.path.join(tmp_dir, f'run-{i}.dat')
+        chunk[order].tofile(path)
+        runs.append((path, len(chunk)))
+    return runs
+
+def _merge_runs(runs:list, rectype, key:list, block_records:int, out):
+    """Merges sorted runs into an open output file.
+       Each step outputs the buffered records whose key is not above the
+       smallest last key among the buffered blocks; those records cannot be
+       preceded by anything still on disk. Ties are written in run order.
+    """
+    maps = [np.memmap(path, dtype=rectype, mode='r', shape=(n,)) for path, n in runs]
+
+    # Blocks are moved as opaque records; structured concatenation would
+    # check thousands of fields on every step
+    rawtype = np.dtype((np.void, rectype.itemsize))
+    starts = [0] * len(runs)
+    blocks = [None] * len(runs)
+    keys = [None] * len(runs)
+
+    while True:
+        # Refill consumed blocks
+        for i, records in enumerate(maps):
+            if (blocks[i] is None or len(blocks[i]) == 0) and starts[i] < len(records):
+                block = np.array(records[starts[i]:starts[i] + block_records])
+                keys[i] = encode_sort_key(block, key)
+                blocks[i] = block.view(rawtype)
+                starts[i] += len(blocks[i])
+
+        active = [i for i in range(len(runs)) if blocks[i] is not None and len(blocks[i]) > 0]
+        if not active:
+            return
+
+        # Runs with data left on disk bound what can be written
+        bounded = [i for i in active if starts[i] < len(maps[i])]
+        bound = min(keys[i][-1] for i in bounded) if bounded else None
+
+        # The first run ending on the bound may still hold equal keys on disk,
+        # so later runs only give up keys strictly below the bound
+        first = None if bound is None else min(i for i in bounded if keys[i][-1] == bound)
+
+        taken, taken_keys = [], []
+        for i in active:
+            if bound is None:
+                n = len(blocks[i])
+            else:
+                n = np.searchsorted(keys[i], bound, side='right' if i <= first else 'left')
+            taken.append(blocks[i][:n])
+            taken_keys.append(keys[i][:n])
+            blocks[i], keys[i] = blocks[i][n:], keys[i][n:]
+
+        # Runs are concatenated in file order, so a stable sort keeps ties in file order
+        merged = np.concatenate(taken)
+        order = np.argsort(np.concatenate(taken_keys), kind='stable')
+        merged[order].tofile(out)
+
+def sort_feh_file(
+        header_file:str,
+        data_file:str,
+        out_file:str,
+        key,
+        file_type:str = 'person',
+        memory_budget:int = SORT_MEMORY_BUDGET):
+    """Sorts the records of a DYNASIM data file by one or more fields.
+       Memory use is bounded by memory_budget rather than the file size.
+       Records with equal keys keep their original order.
+
+    Args:
+        header_file (str): the path to a DYNASIM header file
+        data_file (str): the path to a raw or compressed DYNASIM data file
+        out_file (str): the path of the sorted data file to write
+        key (str|list): field or fields to sort by, most significant first
+        file_type (str): 'person' or 'family' file. Defaults to 'person'.
+        memory_budget (int, optional): approximate memory to use, in bytes
+
+    Returns:
+        int: number of records written
+    """
+    key = [key] if isinstance(key, str) else list(key)
+    rectype = get_rec_dtype(header_file, file_type)
+
+    missing_vars = [field for field in key if field not in rectype.names]
+    if missing_vars:
+        raise ValueError(f"Fields missing from the data:\n{missing_vars}\n"
+                         f"\nAvailable variables are:\n{rectype.names}")
+
+    # A run is held twice while sorting: once as read and once reordered
+    run_records = max(1, memory_budget // (2 * rectype.itemsize))
+
+    out_dir = os.path.dirname(os.path.abspath(out_file))
+    tmp_out = f"{out_file}.tmp-{os.getpid()}"
+
+    try:
+        with tempfile.TemporaryDirectory(dir=out_dir) as tmp_dir:
+            runs = _write_sorted_runs(data_file, rectype, key, run_records, tmp_dir)
+            nrec = sum(n for _, n in runs)
+
+            if len(runs) <= 1:
+                # Nothing to merge
+                if runs:
+                    os.replace(runs[0][0], tmp_out)
+                else:
+                    open(tmp_out, 'wb').close()
+            else:
+                # Merge buffers for all runs plus the merged output share the budget
+                block_records = max(1, memory_budget // (2 * (len(runs) + 1) * rectype.itemsize))
+                with open(tmp_out, 'wb') as out:
+                    _merge_runs(runs, rectype, key, block_records, out)
+
+        os.replace(tmp_out, out_file)
+
+    finally:
+        if os.path.exists(tmp_out):
+            os.remove(tmp_out)
+
+    return nrec
@@ -0,0 +1,226 @@
+"""
+Class defining a sparse DYNASIM-FEH MTS variable.
+
+Most yearly cells of an MTS variable are zero (or another fill value)
+before birth, after death or out of the labor force. SparseMts keeps, for
+each record, only the span between its first and last non-fill year:
+
+    - first, last: column of the first and last non-fill year (-1 if none),
+    - indptr: offset of each record's span in payload, and
+    - payload: the values of all spans, one record after another.
+
+Dense records are rebuilt exactly by to_dense(). Reductions and the long
+format are computed from the spans without expanding them.
+
+    earnings = SparseMts.from_reader(header_file, person_file, 'EARNINGS')
+    lifetime = earnings.sum()
+    long = earnings.to_long()
+"""
+from feh_io.feh_reader import FehReader
+from feh_io.mts import mts_matrix
+from feh_io.read_feh import get_record_dict, make_rec_dtype, get_mts_years
+import numpy as np
+
+# Bytes of whole records read at a time by SparseMts.from_reader. FehReader
+# reads full records before selecting fields, so chunks are sized by record
+# width: 2,048 person records of 16 KB.
+SPARSE_CHUNK_BYTES = 32 * 2**20
+
+class SparseMts:
+    """
+    Class holding one MTS variable as per-record spans of non-fill years.
+    """
+    def __init__(self, var:str, first_year:int, nyears:int, first, last, indptr, payload,
+                 ids = None, id_var:str = None, fill:int = 0):
+        self.var = var
+        self.first_year = first_year
+        self.nyears = nyears
+        self.first = first
+        self.last = last
+        self.indptr = indptr
+        self.payload = payload
+        self.ids = ids
+        self.id_var = id_var
+        self.fill = fill
+
+    def __len__(self):
+        return len(self.first)
+
+    def __repr__(self):
+        return (f"SparseMts(var={self.var!r}, records={len(self)}, "
+                f"years={self.first_year}-{self.first_year + self.nyears - 1}, "
+                f"density={self.density:.3f})")
+
+    @property
+    def years(self):
+        return np.arange(self.first_year, self.first_year + self.nyears)
+
+    @property
+    def lengths(self):
+        """Number of years in each record's span"""
+        return np.diff(self.indptr)
+
+    @property
+    def density(self):
+        """Share of the dense cells held in payload"""
+        return len(self.payload) / max(1, len(self) * self.nyears)
+
+    @property
+    def nbytes(self):
+        arrays = [self.first, self.last, self.indptr, self.payload]
+        return sum(a.nbytes for a in arrays) + (0 if self.ids is None else self.ids.nbytes)
+
+    @classmethod
+    def from_matrix(cls, matrix, var:str, first_year:int, ids = None, id_var:str = None, fill:int = 0):
+        """Encodes a (records x years) matrix, e.g. from mts_matrix
+
+        Args:
+            matrix (np.array): matrix of shape (records, years)
+            var (str): MTS variable name
+            first_year (int): year of the first column
+            ids (np.array, optional): identifier of each record
+            id_var (str, optional): name of the identifier, e.g. 'PERNUM'
+            fill (int, optional): value that is not stored. Defaults to 0.
+
+        Returns:
+            SparseMts: data
+        """
+        nrec, nyears = matrix.shape
+        present = matrix != fill
+        has = present.any(axis=1)
+
+        first = np.where(has, np.argmax(present, axis=1), -1).astype(np.int32)
+        last = np.where(has, nyears - 1 - np.argmax(present[:, ::-1], axis=1), -1).astype(np.int32)
+
+        indptr = np.zeros(nrec + 1, dtype=np.int64)
+        np.cumsum(np.where(has, last - first + 1, 0), out=indptr[1:])
+
+        # Boolean indexing walks the matrix row by row, so spans come out in record order
+        columns = np.arange(nyears)
+        in_span = (columns >= first[:, None]) & (columns <= last[:, None])
+        payload = np.ascontiguousarray(matrix[in_span])
+
+        return cls(var, first_year, nyears, first, last, indptr, payload,
+                   None if ids is None else np.asarray(ids).copy(), id_var, fill)
+
+    @classmethod
+    def concatenate(cls, parts:list):
+        """Joins SparseMts of the same variable and years, one after another"""
+        head = parts[0]
+
+        def layout(p):
+            return (p.var, p.first_year, p.nyears, p.id_var, p.fill)
+
+        if any(layout(p) != layout(head) for p in parts):
+            raise ValueError("Only SparseMts of the same variable, years and fill can be concatenated")
+
+        offsets = np.cumsum([0] + [len(p.payload) for p in parts[:-1]])
+        indptr = np.concatenate([[0]] + [p.indptr[1:] + off for p, off in zip(parts, offsets)])
+        ids = None if any(p.ids is None for p in parts) else np.concatenate([p.ids for p in parts])
+
+        return cls(head.var, head.first_year, head.nyears,
+                   np.concatenate([p.first for p in parts]),
+                   np.concatenate([p.last for p in parts]),
+                   indptr,
+                   np.concatenate([p.payload for p in parts]),
+                   ids, head.id_var, head.fill)
+
+    @classmethod
+    def from_reader(cls, header_file:str, data_file:str, var:str, years = None, file_type:str = 'person',
+                    id_var:str = 'PERNUM', fill:int = 0, chunk_size:int = None):
+        """Encodes an MTS variable while streaming a data file with FehReader,
+           so only one dense chunk is held in memory at a time.
+
+        Args:
+            header_file (str): the path to a DYNASIM header file
+            data_file (str): the path to a raw or compressed DYNASIM data file
+            var (str): MTS variable name, e.g. 'EARNINGS'
+            years (tuple, optional): (first, last) years, inclusive. All
+                years of the variable if None.
+            file_type (str): 'person' or 'family' file. Defaults to 'person'.
+            id_var (str, optional): variable identifying records, kept as
+                ids. None to keep no identifier.
+            fill (int, optional): value that is not stored. Defaults to 0.
+            chunk_size (int, optional): number of records read at a time,
+                about SPARSE_CHUNK_BYTES of records if None
+
+        Returns:
+            SparseMts: data
+        """
+        rec = get_record_dict(header_file, file_type)
+        mts_years = get_mts_years(rec)
+        if var not in mts_years:
+            raise ValueError(f"Fields missing from the data:\n{[var]}\n"
+                             f"\nAvailable variables are:\n{tuple(mts_years)}")
+        first, last = mts_years[var] if years is None else years
+
+        var_list = [f"{var}{year}" for year in range(first, last + 1)]
+        if id_var is not None:
+            var_list = [id_var] + var_list
+
+        chunk_size = chunk_size or max(1, SPARSE_CHUNK_BYTES // make_rec_dtype(rec).itemsize)
+        reader = FehReader(header_file, data_file, file_type, chunk_size=chunk_size, var_list=var_list)
+        parts = []
+        try:
+            # An empty file still gives one (empty) part
+            chunk = reader.read_chunk()
+            while True:
+                matrix = mts_matrix(chunk, var, years=(first, last))
+                ids = None if id_var is None else chunk[id_var]
+                parts.append(cls.from_matrix(matrix, var, first, ids, id_var, fill))
+
+                chunk = reader.read_chunk()
+                if len(chunk) == 0:
+                    break
+        finally:
+            reader.close()
+
+        return cls.concatenate(parts)
+
+    def _span_sums(self, values):
+        """Sums values over each record's span"""
+        totals = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(values, out=totals[1:])
+        return totals[self.indptr[1:]] - totals[self.indptr[:-1]]
+
+    def sum(self):
+        """Total over years of each record, as int64"""
+        return self._span_sums(self.payload) + self.fill * (self.nyears - self.lengths)
+
+    def count_nonzero(self):
+        """Number of nonzero years of each record"""
+        counts = self._span_sums(self.payload != 0)
+        if self.fill != 0:
+            counts += self.nyears - self.lengths
+        return counts
+
+    def _cells(self):
+        """Record and column of each payload value"""
+        rows = np.repeat(np.arange(len(self)), self.lengths)
+        columns = np.arange(len(self.payload)) - self.indptr[rows] + self.first[rows]
+        return rows, columns
+
+    def to_dense(self):
+        """Rebuilds the (records x years) matrix"""
+        dense = np.full((len(self), self.nyears), self.fill, dtype=self.payload.dtype)
+        rows, columns = self._cells()
+        dense[rows, columns] = self.payload
+        return dense
+
+    def to_long(self):
+        """Converts the spans to long format, one row per stored year.
+           Years outside a record's span hold the fill value and are left out.
+
+        Returns:
+            numpy structured array: year, the id variable (or record index)
+            and the value, with lowercase names as in feh_wide_to_long
+        """
+        rows, columns = self._cells()
+        id_name = 'record' if self.ids is None else (self.id_var or 'id').lower()
+        id_type = np.int64 if self.ids is None else self.ids.dtype
+
+        out = np.empty(len(self.payload), dtype=[('year', 'i4'), (id_name, id_type), (self.var.lower(), self.payload.dtype)])
+        out['year'] = self.first_year + columns
+        out[id_name] = rows if self.ids is None else self.ids[rows]
+        out[self.var.lower()] = self.payload
+        return out
@@ -0,0 +1,195 @@
+"""
+Functions for counting year-over-year transitions of DYNASIM-FEH MTS variables.
+
+transition_counts counts, for every pair of adjacent years, how many records
+move from one state of a categorical MTS variable (WEDSTATE, LFPART,
+DISABLED, ...) to another, optionally by group. Counts are computed from
+the adjacent columns of the MTS matrix of each chunk of records, without
+reshaping to long format, and the chunks are counted on a worker pool.
+
+    counts = transition_counts(header_file, person_file, 'WEDSTATE', years=(2006, 2010),
+                               by='AGE', by_fn=lambda age: (2006 - age) // 10 * 10)
+"""
+from feh_io.read_feh import get_record_dict, make_rec_dtype, get_mts_years, read_record_fields
+from feh_io.compression import detect_compression
+from feh_io.feh_reader import FehReader
+from feh_io.mts import mts_matrix
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import os
+import numpy as np
+
+# Number of records counted at a time
+TRANSITION_CHUNK_SIZE = 65_536
+
+# Keys are counted with bincount while the key space is at most this many
+# times the number of transitions in a chunk, and with np.unique beyond
+_BINCOUNT_DENSITY = 4
+
+def _count_dtype(by:str, by_type = np.int32):
+    fields = [('from_state', 'i4'), ('to_state', 'i4'), ('year', 'i4')]
+    if by is not None:
+        fields.append((by.lower(), by_type))
+    return np.dtype(fields + [('count', 'i8')])
+
+def _count_chunk(chunk, var:str, first:int, last:int, by:str):
+    """Counts the transitions of one chunk of records
+
+    Returns:
+        numpy structured array: from_state, to_state, year[, by], count
+    """
+    matrix = mts_matrix(chunk, var, years=(first, last))
+    nrec, nyears = matrix.shape
+    ntrans = nyears - 1
+
+    # Codes of the states and groups present in this chunk
+    states, codes = np.unique(matrix, return_inverse=True)
+    codes = codes.reshape(nrec, nyears)
+    if by is None:
+        groups, group_codes = np.zeros(1, dtype=np.int32), np.zeros(nrec, dtype=np.intp)
+    else:
+        groups, group_codes = np.unique(chunk[by], return_inverse=True)
+
+    # One integer key per transition: (group, from, to, year)
+    nstates = len(states)
+    key = group_codes.astype(np.int64)[:, None]
+    key = (key * nstates + codes[:, :-1]) * nstates + codes[:, 1:]
+    key = key * ntrans + np.arange(ntrans)
+
+    space = len(groups) * nstates * nstates * ntrans
+    if space <= _BINCOUNT_DENSITY * key.size:
+        counts = np.bincount(key.ravel(), minlength=space)
+        keys = np.flatnonzero(counts)
+        counts = counts[keys]
+    else:
+        keys, counts = np.unique(key, return_counts=True)
+
+    # Decode keys back to states, year and group
+    rest, year = np.divmod(keys, ntrans)
+    rest, to_code = np.divmod(rest, nstates)
+    group_code, from_code = np.divmod(rest, nstates)
+
+    out = np.empty(len(keys), dtype=_count_dtype(by, groups.dtype))
+    out['from_state'] = states[from_code]
+    out['to_state'] = states[to_code]
+    out['year'] = first + 1 + year
+    if by is not None:
+        out[by.lower()] = groups[group_code]
+    out['count'] = counts
+    return out
+
+def merge_counts(parts:list):
+    """Sums transition counts with the same from_state, to_state, year and group"""
+    data = np.concatenate(parts)
+    keys = data[[name for name in data.dtype.names if name != 'count']]
+    unique, inverse = np.unique(keys, return_inverse=True)
+
+    out = np.empty(len(unique), dtype=data.dtype)
+    for name in unique.dtype.names:
+        out[name] = unique[name]
+    out['count'] = np.bincount(inverse.ravel(), weights=data['count'], minlength=len(unique)).astype(np.int64)
+    return out
+
+def _count_range(data_file:str, rectype, fields:list, var:str, first:int, last:int, by:str,
+                 start:int, stop:int, chunk_size:int):
+    """Counts the transitions of records start to stop of a raw data file.
+       Only the counted fields are copied out of the memory-mapped file."""
+    parts = []
+    for lo in range(start, stop, chunk_size):
+        chunk = read_record_fields(data_file, rectype, fields, lo, min(lo + chunk_size, stop))
+        parts.append(_count_chunk(chunk, var, first, last, by))
+    return merge_counts(parts) if parts else np.empty(0, dtype=_count_dtype(by))
+
+def transition_counts(
+        header_file:str,
+        data_file:str,
+        var:str,
+        years:tuple = None,
+        by:str = None,
+        by_fn = None,
+        file_type:str = 'person',
+        chunk_size:int = TRANSITION_CHUNK_SIZE,
+        max_workers:int = None,
+        use_threads:bool = False):
+    """Counts year-over-year transitions between the states of an MTS variable
+
+    Args:
+        header_file (str): the path to a DYNASIM header file
+        data_file (str): the path to a raw or compressed DYNASIM data file
+        var (str): MTS variable name, e.g. 'WEDSTATE'
+        years (tuple, optional): (first, last) years, inclusive. All years
+            of the variable if None.
+        by (str, optional): scalar field to count by, e.g. 'SEX'
+        by_fn (callable, optional): function mapping by values to groups,
+            e.g. lambda age: (2006 - age) // 10 * 10. Applied to the counts
+            after they are merged, so it need not be picklable.
+        file_type (str): 'person' or 'family' file. Defaults to 'person'.
+        chunk_size (int, optional): number of records counted at a time
+        max_workers (int, optional): number of workers, all cores if None.
+            Compressed files are always counted in one stream.
+        use_threads (bool, optional): use threads instead of processes
+
+    Returns:
+        numpy structured array: from_state, to_state, year (of to_state),
+        the by group in lowercase if given, and count, sorted in that order
+    """
+    rec = get_record_dict(header_file, file_type)
+    rectype = make_rec_dtype(rec)
+    mts_years = get_mts_years(rec)
+
+    if var not in mts_years:
+        raise ValueError(f"Fields missing from the data:\n{[var]}\n"
+                         f"\nAvailable variables are:\n{tuple(mts_years)}")
+    first, last = mts_years[var] if years is None else years
+    if last <= first:
+        raise ValueError(f"years must span at least two years but not {(first, last)}")
+
+    fields = [f"{var}{year}" for year in range(first, last + 1)] + ([] if by is None else [by])
+    missing_vars = [field for field in fields if field not in rectype.names]
+    if missing_vars:
+        raise ValueError(f"Fields missing from the data:\n{missing_vars}\n"
+                         f"\nAvailable variables are:\n{rectype.names}")
+
+    max_workers = max_workers or os.cpu_count() or 1
+
+    nrec = None if detect_compression(data_file) is not None else os.path.getsize(data_file) // rectype.itemsize
+
+    if nrec is None:
+        # Compressed files are one sequential stream
+        parts = []
+        reader = FehReader(header_file, data_file, file_type, chunk_size=chunk_size, var_list=fields)
+        try:
+            while True:
+                chunk = reader.read_chunk()
+                if len(chunk) == 0:
+                    break
+                parts.append(_count_chunk(chunk, var, first, last, by))
+        finally:
+            reader.close()
+    elif max_workers == 1:
+        parts = [_count_range(data_file, rectype, fields, var, first, last, by, 0, nrec, chunk_size)]
+    else:
+        # Record ranges counted in parallel, a few per worker to balance load
+        step = max(chunk_size, -(-nrec // (4 * max_workers)))
+        ranges = [(lo, min(lo + step, nrec)) for lo in range(0, nrec, step)]
+
+        Executor = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+        with Executor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_count_range, data_file, rectype, fields, var, first, last, by,
+                                       start, stop, chunk_size) for start, stop in ranges]
+            parts = [future.result() for future in futures]
+
+    if not parts:
+        return np.empty(0, dtype=_count_dtype(by))
+
+    counts = merge_counts(parts)
+
+    if by_fn is not None:
+        # Regroup the merged counts rather than every record
+        groups = np.asarray(by_fn(counts[by.lower()]))
+        dtype = _count_dtype(by, groups.dtype)
+        grouped = np.empty(len(counts), dtype=dtype)
+        for name in dtype.names:
+            grouped[name] = groups if name == by.lower() else counts[name]
+        counts = merge_counts([grouped])
+
+    return counts
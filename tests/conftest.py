@@ -0,0 +1,64 @@
+"""
+Shared fixtures for feh_io tests.
+
+Binary person and family files are built from the header and the 10-record
+extract used by the R package tests.
+"""
+
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from feh_io.read_feh import get_rec_dtype
+
+FIXTURES = os.path.join(os.path.dirname(__file__), '..', 'R', 'FEHreadR', 'tests', 'testthat', 'fixtures')
+HEADER_FILE = os.path.join(FIXTURES, 'dynasipp_header_even.dat')
+PERSON_CSV = os.path.join(FIXTURES, 'fehout_10obs.csv')
+
+def make_person_records(nrec:int = 10, seed:int = 0):
+    """Creates person records by repeating the 10-record extract.
+       Records after the first 10 get new PERNUM, AGE and EARNINGS values."""
+    rectype = get_rec_dtype(HEADER_FILE, 'person')
+    df = pd.read_csv(PERSON_CSV, index_col=0)
+
+    block = df.to_numpy(dtype=np.int32)
+    block = np.resize(block, (nrec, block.shape[1]))
+    data = np.ascontiguousarray(block).view(rectype).reshape(nrec)
+
+    if nrec > 10:
+        rng = np.random.default_rng(seed)
+        data['PERNUM'] = np.arange(1, nrec + 1)
+        data['AGE'] = rng.integers(0, 100, nrec)
+        for year in range(2006, 2011):
+            data[f'EARNINGS{year}'] = rng.integers(0, 3, nrec) * rng.integers(0, 80000, nrec)
+    return data
+
+def make_family_records(nrec:int = 10):
+    """Creates family records with sequential FAMNUM values"""
+    rectype = get_rec_dtype(HEADER_FILE, 'family')
+    data = np.zeros(nrec, dtype=rectype)
+    data['FAMNUM'] = np.arange(1, nrec + 1)
+    data['MEMBERS'] = np.arange(nrec) % 4 + 1
+    return data
+
+def write_run(run_dir, person:np.ndarray, family:np.ndarray, parity:str = 'even'):
+    """Writes a header, person and family file into run_dir"""
+    os.makedirs(run_dir, exist_ok=True)
+    header_file = os.path.join(run_dir, f'dynasipp_header_{parity}.dat')
+    person_file = os.path.join(run_dir, f'dynasipp_person_{parity}.dat')
+    family_file = os.path.join(run_dir, f'dynasipp_family_{parity}.dat')
+    shutil.copyfile(HEADER_FILE, header_file)
+    person.tofile(person_file)
+    family.tofile(family_file)
+    return header_file, person_file, family_file
+
+@pytest.fixture
+def feh_files(tmp_path):
+    """(header_file, person_file, family_file) for 10 persons and 10 families"""
+    return write_run(str(tmp_path / 'run'), make_person_records(), make_family_records())
+
+@pytest.fixture
+def large_feh_files(tmp_path):
+    """(header_file, person_file, family_file) for 1000 persons and 100 families"""
+    return write_run(str(tmp_path / 'run'), make_person_records(1000), make_family_records(100))
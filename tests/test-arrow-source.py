@@ -0,0 +1,80 @@
+"""
+Tests for the Arrow record batch reader and fragment scanner.
+
+To run, use `pytest tests/test-arrow-source.py`
+"""
+
+import gzip
+import tracemalloc
+import shutil
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pytest
+from feh_io import feh_record_batch_reader, FehScanner, read_feh_data_file
+from feh_io.arrow_source import ARROW_BATCH_BYTES
+
+COLUMNS = ['PERNUM', 'AGE', 'EARNINGS2006', 'EARNINGS2007', 'EARNINGS2008']
+
+def test_record_batch_reader(large_feh_files, tmp_path):
+    header_file, person_file, _ = large_feh_files
+    data = read_feh_data_file(header_file, person_file)
+
+    reader = feh_record_batch_reader(header_file, person_file, columns=['PERNUM', 'AGE', 'EARNINGS'],
+                                     years=(2006, 2008), batch_records=300)
+    assert isinstance(reader, pa.RecordBatchReader)
+    assert reader.schema.names == COLUMNS
+
+    batches = list(reader)
+    assert [batch.num_rows for batch in batches] == [300, 300, 300, 100]
+    table = pa.Table.from_batches(batches)
+    assert pc.sum(table['EARNINGS2007']).as_py() == int(data['EARNINGS2007'].sum())
+
+    # Compressed files stream through FehReader too
+    gz_file = str(tmp_path / 'person.dat.gz')
+    with open(person_file, 'rb') as src, gzip.open(gz_file, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    table = feh_record_batch_reader(header_file, gz_file, columns=['PERNUM']).read_all()
+    assert np.array_equal(table['PERNUM'].to_numpy(), data['PERNUM'])
+
+def test_scanner(large_feh_files):
+    header_file, person_file, _ = large_feh_files
+    data = read_feh_data_file(header_file, person_file)
+
+    scanner = FehScanner(header_file, person_file, columns=['PERNUM', 'AGE', 'EARNINGS'],
+                         years=(2006, 2008), fragment_records=128, max_workers=3)
+    fragments = scanner.get_fragments()
+    assert len(fragments) == 8
+    assert fragments[-1].start == 896 and fragments[-1].stop == 1000
+    assert scanner.count_rows() == len(data)
+
+    # Threaded reads come back in file order
+    table = scanner.to_reader().read_all()
+    assert table.schema.names == COLUMNS
+    for name in COLUMNS:
+        assert np.array_equal(table[name].to_numpy(), data[name])
+
+    serial = FehScanner(header_file, person_file, columns=['AGE'], use_threads=False, fragment_records=128).to_table()
+    assert np.array_equal(serial['AGE'].to_numpy(), data['AGE'])
+
+    with pytest.raises(ValueError, match="Fields missing"):
+        FehScanner(header_file, person_file, columns=['EARNIGNS'])
+
+def test_scanner_copies_selected_fields_only(large_feh_files):
+    header_file, person_file, _ = large_feh_files
+    data = read_feh_data_file(header_file, person_file, var_list=['PERNUM', 'AGE'])
+
+    # Fragments are sized by the bytes of the selected fields
+    scanner = FehScanner(header_file, person_file, columns=['PERNUM', 'AGE'], max_workers=2)
+    assert scanner.fragment_records == ARROW_BATCH_BYTES // 8
+
+    # Whole records would take 16 MB; the selected fields take 8 KB
+    scanner = FehScanner(header_file, person_file, columns=['PERNUM', 'AGE'], fragment_records=250, max_workers=2)
+    tracemalloc.start()
+    try:
+        table = scanner.to_table()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 2**20
+    assert np.array_equal(table['AGE'].to_numpy(), data['AGE'])
@@ -0,0 +1,91 @@
+"""
+Tests for the feh-io command line interface.
+
+To run, use `pytest tests/test-cli.py`
+"""
+
+import json
+import os
+import numpy as np
+import pytest
+import pyarrow.parquet as pq
+from feh_io.cli import main, plan_conversions, MANIFEST_NAME
+from tests.conftest import make_person_records, make_family_records, write_run
+
+def test_convert(tmp_path, capsys):
+    run_dir = str(tmp_path / 'run-1006-baseline')
+    out_dir = str(tmp_path / 'out')
+    person = make_person_records(30)
+    write_run(os.path.join(run_dir, 'base-v8'), person, make_family_records(), 'even')
+    write_run(os.path.join(run_dir, 'base-v8'), person[:5], make_family_records(), 'odd')
+
+    assert main(['convert', run_dir, '--out', out_dir, '--workers', '2', '--chunk-size', '7']) == 0
+    assert '4 converted, 0 skipped' in capsys.readouterr().out
+
+    out_file = os.path.join(out_dir, 'run-1006-baseline', 'base-v8', 'dynasipp_person_even.parquet')
+    table = pq.read_table(out_file)
+    assert table.num_rows == 30
+    assert np.array_equal(table.column('PERNUM').to_numpy(), person['PERNUM'])
+
+    with open(os.path.join(out_dir, MANIFEST_NAME)) as file:
+        assert len(json.load(file)) == 4
+
+    # Only the changed file is converted again
+    person[:3].tofile(os.path.join(run_dir, 'base-v8', 'dynasipp_person_odd.dat'))
+    assert main(['convert', run_dir, '--out', out_dir]) == 0
+    assert '1 converted, 3 skipped' in capsys.readouterr().out
+    assert not [f for f in os.listdir(os.path.dirname(out_file)) if '.tmp-' in f]
+
+def test_convert_runs_with_same_name(tmp_path, capsys):
+    out_dir = str(tmp_path / 'out')
+    person = make_person_records(20)
+    run_1 = str(tmp_path / 'run-1' / 'base-v8')
+    run_2 = str(tmp_path / 'run-2' / 'base-v8')
+    write_run(run_1, person, make_family_records(), 'even')
+    write_run(run_2, person[:5], make_family_records(), 'even')
+
+    # Without a root both runs would be written to out/base-v8
+    with pytest.raises(ValueError):
+        plan_conversions([run_1, run_2], out_dir)
+
+    assert main(['convert', run_1, run_2, '--out', out_dir, '--root', str(tmp_path), '--workers', '1']) == 0
+    assert '4 converted' in capsys.readouterr().out
+
+    for run, nrec in [('run-1', 20), ('run-2', 5)]:
+        out_file = os.path.join(out_dir, run, 'base-v8', 'dynasipp_person_even.parquet')
+        assert pq.read_table(out_file).num_rows == nrec
+
+def test_convert_rejects_output_collisions(tmp_path):
+    # A run directory nested in another one is discovered twice
+    run_dir = str(tmp_path / 'run')
+    write_run(os.path.join(run_dir, 'base-v8'), make_person_records(), make_family_records(), 'even')
+
+    with pytest.raises(ValueError):
+        plan_conversions([run_dir, os.path.join(run_dir, 'base-v8')], str(tmp_path / 'out'))
+
+def test_output_paths_are_stable(tmp_path, capsys):
+    out_dir = str(tmp_path / 'out')
+    run_1 = str(tmp_path / 'a' / 'run-1006-baseline')
+    run_2 = str(tmp_path / 'b' / 'run-1007-reform')
+    write_run(run_1, make_person_records(10), make_family_records(), 'even')
+    write_run(run_2, make_person_records(5), make_family_records(), 'even')
+
+    # A run is planned to the same outputs whatever runs it is converted with
+    alone = plan_conversions([run_1], out_dir)
+    together = plan_conversions([run_1, run_2], out_dir)
+    assert alone == together[:len(alone)]
+    assert alone[0][3] == os.path.join(out_dir, 'run-1006-baseline', 'dynasipp_person_even.parquet')
+
+    assert main(['convert', run_1, '--out', out_dir, '--workers', '1']) == 0
+    assert '2 converted' in capsys.readouterr().out
+
+    # Moving the outputs under a root converts the unchanged inputs again
+    assert main(['convert', run_1, '--out', out_dir, '--root', str(tmp_path), '--workers', '1']) == 0
+    assert '2 converted, 0 skipped' in capsys.readouterr().out
+    assert os.path.exists(os.path.join(out_dir, 'a', 'run-1006-baseline', 'dynasipp_person_even.parquet'))
+
+    assert main(['convert', run_1, '--out', out_dir, '--root', str(tmp_path), '--workers', '1']) == 0
+    assert '0 converted, 2 skipped' in capsys.readouterr().out
+
+    with pytest.raises(ValueError):
+        plan_conversions([run_1], out_dir, root=str(tmp_path / 'b'))
@@ -0,0 +1,84 @@
+"""
+Tests for DYNASIM FEH codebook parsing and character-mode reading.
+
+To run, use `pytest tests/test-codebook.py`
+"""
+
+import os
+import numpy as np
+import pytest
+from feh_io import parse_codebook, read_feh_char_file
+
+CODEBOOK = os.path.join(os.path.dirname(__file__), '..', 'codebook_2087ds.sipp2006')
+
+@pytest.fixture
+def layout():
+    return parse_codebook(CODEBOOK)
+
+def write_char_file(path, rec, values, newline=b'\r\n'):
+    """Writes right-justified records in the codebook layout"""
+    with open(path, 'wb') as file:
+        for row in values:
+            line = bytearray(b' ' * rec['rlen'])
+            for name, start, end in zip(rec['names'], rec['start'], rec['end']):
+                if name in row:
+                    line[start-1:end] = str(row[name]).rjust(end - start + 1).encode()
+            file.write(bytes(line) + newline)
+
+def test_parse_codebook(layout):
+    assert layout['mode'] == 'CHAR'
+    assert layout['base'] == 2006
+
+    fam, per = layout['family'], layout['person']
+    assert fam['names'][:3] == ['SEGTYPE', 'MEMBERS', 'FAMNUM']
+    assert fam['rlen'] == 139
+
+    i = per['names'].index('EARNINGS')
+    assert (per['start'][i], per['end'][i], per['width'][i]) == (62, 67, 6)
+    assert (per['mtsly'][i], per['mtshy'][i], per['mtsio'][i]) == (1951, 2087, 'INOUT')
+
+    i = per['names'].index('AGE')
+    assert (per['mtsly'][i], per['mtshy'][i], per['mtsio'][i]) == (0, 0, '')
+
+def test_read_feh_char_file(layout, tmp_path):
+    rows = [{'SEGTYPE': 2, 'AGE': 45, 'EARNINGS': 52000, 'WEDSTATE': 1},
+            {'SEGTYPE': 2, 'AGE': 3, 'EARNINGS': -120, 'WEDSTATE': 0},
+            {'SEGTYPE': 2, 'AGE': 80, 'EARNINGS': 0, 'WEDSTATE': 4}]
+    data_file = tmp_path / 'person.txt'
+    write_char_file(data_file, layout['person'], rows)
+
+    data = read_feh_char_file(layout, str(data_file), file_type='person')
+    assert len(data) == 3
+    for var in ['SEGTYPE', 'AGE', 'EARNINGS', 'WEDSTATE']:
+        assert data[var].tolist() == [row[var] for row in rows]
+
+    # Projection, count and offset behave like read_feh_data_file
+    width = layout['person']['rlen'] + 2
+    data = read_feh_char_file(CODEBOOK, str(data_file), var_list=['AGE'],
+                              count=1, offset=width, chunk_size=1)
+    assert data.dtype.names == ('AGE',)
+    assert data['AGE'].tolist() == [3]
+
+@pytest.mark.parametrize('newline', [b'\n', b'\r\n'])
+def test_read_feh_char_file_unterminated(layout, tmp_path, newline):
+    rows = [{'SEGTYPE': 2, 'AGE': 45}, {'SEGTYPE': 2, 'AGE': 3}, {'SEGTYPE': 2, 'AGE': 80}]
+    data_file = tmp_path / 'person.txt'
+    write_char_file(data_file, layout['person'], rows, newline)
+
+    # Drop the terminator of the last record
+    with open(data_file, 'r+b') as file:
+        file.truncate(os.path.getsize(data_file) - len(newline))
+
+    data = read_feh_char_file(layout, str(data_file), var_list=['AGE'], chunk_size=2)
+    assert data['AGE'].tolist() == [45, 3, 80]
+
+    data = read_feh_char_file(layout, str(data_file), var_list=['AGE'], count=2)
+    assert data['AGE'].tolist() == [45, 3]
+
+def test_read_feh_char_file_bad_width(layout, tmp_path):
+    data_file = tmp_path / 'family.txt'
+    with open(data_file, 'wb') as file:
+        file.write(b'1 2\n12345\n')
+
+    with pytest.raises(ValueError):
+        read_feh_char_file(layout, str(data_file), file_type='family')
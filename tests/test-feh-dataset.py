@@ -0,0 +1,60 @@
+"""
+Tests for the multi-run FehDataset.
+
+To run, use `pytest tests/test-feh-dataset.py`
+"""
+
+from feh_io import FehDataset
+from tests.conftest import make_person_records, make_family_records, write_run
+
+def adults(data):
+    return data['AGE'] >= 18
+
+def total_age(data):
+    return int(data['AGE'].sum())
+
+def test_feh_dataset(tmp_path):
+    person = make_person_records(50)
+    family = make_family_records(5)
+    write_run(str(tmp_path / 'run-1006-baseline' / 'base-v8'), person, family, 'even')
+    write_run(str(tmp_path / 'run-1006-baseline' / 'base-v8'), person[:20], family, 'odd')
+    write_run(str(tmp_path / 'run-1007-reform' / 'reform-v1'), person[:30], family, 'even')
+
+    ds = FehDataset(str(tmp_path), max_workers=2)
+    assert len(ds) == 6
+    assert ds.scenarios == ['run-1006-baseline', 'run-1007-reform']
+    assert ('run-1006-baseline', 'base-v8') in ds.runs
+
+    # Every header is parsed once for each file type
+    for p in ds.partitions:
+        ds.schema(p)
+    assert len(ds._schemas) == 6
+
+    df = ds.read(var_list=['PERNUM', 'AGE'])
+    assert len(df) == 100
+    assert set(df.columns) == {'PERNUM', 'AGE', 'scenario', 'run', 'parity'}
+    assert (df['parity'] == 'odd').sum() == 20
+
+    fam = ds.subset(parity='even').read(file_type='family', var_list=['FAMNUM'])
+    assert len(fam) == 10
+
+    totals = ds.aggregate(total_age, combine=lambda r: sum(r.values()), where=adults)
+    expected = sum(int(person[:n]['AGE'][person[:n]['AGE'] >= 18].sum()) for n in [50, 20, 30])
+    assert totals == expected
+
+def test_feh_dataset_threads(tmp_path):
+    write_run(str(tmp_path / 'scenario' / 'run'), make_person_records(), make_family_records())
+
+    ds = FehDataset(str(tmp_path), use_threads=True)
+    results = ds.aggregate(lambda data: len(data))
+    assert list(results.values()) == [10]
+
+    p = next(iter(results))
+    assert (p.scenario, p.run, p.parity, p.file_type) == ('scenario', 'run', 'even', 'person')
+
+def test_feh_dataset_empty_read(tmp_path):
+    write_run(str(tmp_path / 'scenario' / 'run'), make_person_records(), make_family_records())
+
+    df = FehDataset(str(tmp_path), use_threads=True).subset(scenarios=['missing']).read(var_list=['PERNUM'])
+    assert len(df) == 0
+    assert list(df.columns) == ['PERNUM', 'scenario', 'run', 'parity']
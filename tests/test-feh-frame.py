@@ -0,0 +1,107 @@
+"""
+Tests for the lazy FehFrame query API.
+
+To run, use `pytest tests/test-feh-frame.py`
+"""
+
+import numpy as np
+import pytest
+import pyarrow.parquet as pq
+from feh_io import FehFrame, read_feh_data_file, feh_wide_to_long
+
+def test_select_where_years(large_feh_files):
+    header_file, person_file, _ = large_feh_files
+    data = read_feh_data_file(header_file, person_file)
+    adults = data[data['AGE'] >= 18]
+
+    frame = (FehFrame(header_file, person_file, chunk_size=64)
+             .select('PERNUM', 'EARNINGS')
+             .where('AGE', '>=', 18)
+             .years(2006, 2008))
+    out = frame.collect()
+
+    assert out.dtype.names == ('PERNUM', 'EARNINGS2006', 'EARNINGS2007', 'EARNINGS2008')
+    assert np.array_equal(out['PERNUM'], adults['PERNUM'])
+    assert np.array_equal(out['EARNINGS2007'], adults['EARNINGS2007'])
+
+def test_to_long(feh_files):
+    header_file, person_file, _ = feh_files
+    data = read_feh_data_file(header_file, person_file, var_list=['PERNUM', 'EARNINGS2006', 'EARNINGS2007'])
+    expected = feh_wide_to_long(data)
+
+    out = (FehFrame(header_file, person_file, chunk_size=3)
+           .select('PERNUM', 'EARNINGS')
+           .years(2006, 2007)
+           .to_long()
+           .collect())
+
+    assert out.dtype.names == ('year', 'pernum', 'earnings')
+    assert len(out) == len(expected)
+    # Same rows, in record order instead of year order
+    order = np.lexsort((out['year'], out['pernum']))
+    expected_order = np.lexsort((expected['year'], expected['pernum']))
+    assert np.array_equal(out[order], expected[['year', 'pernum', 'earnings']][expected_order])
+
+def test_agg_and_sink(large_feh_files, tmp_path):
+    header_file, person_file, _ = large_feh_files
+    data = read_feh_data_file(header_file, person_file)
+
+    frame = (FehFrame(header_file, person_file, chunk_size=100)
+             .select('EARNINGS')
+             .where('SEX', '==', 1)
+             .years(2006, 2010)
+             .to_long()
+             .agg({'earnings': ['sum', 'count', 'max']}, by=['year']))
+    out = frame.collect()
+
+    men = data[data['SEX'] == 1]
+    assert out['year'].tolist() == list(range(2006, 2011))
+    assert out['earnings_sum'].tolist() == [int(men[f'EARNINGS{y}'].sum()) for y in range(2006, 2011)]
+    assert out['earnings_count'].tolist() == [len(men)] * 5
+    assert out['earnings_max'].tolist() == [int(men[f'EARNINGS{y}'].max()) for y in range(2006, 2011)]
+
+    path = str(tmp_path / 'long.parquet')
+    frame = FehFrame(header_file, person_file, chunk_size=100).select('PERNUM', 'AGE').where('AGE', 'in', [1, 2, 3])
+    frame.sink_parquet(path)
+    table = pq.read_table(path)
+    assert table.num_rows == int(np.isin(data['AGE'], [1, 2, 3]).sum())
+    assert table.column_names == ['PERNUM', 'AGE']
+
+def test_agg_checks_columns(feh_files):
+    header_file, person_file, _ = feh_files
+    frame = FehFrame(header_file, person_file).select('EARNINGS').years(2006, 2007).to_long()
+
+    with pytest.raises(ValueError, match="Fields missing"):
+        frame.agg({'earnigns': 'sum'}, by=['year'])
+    with pytest.raises(ValueError, match="Fields missing"):
+        frame.agg({'earnings': 'sum'}, by=['YEAR'])
+
+def test_to_long_needs_mts(feh_files):
+    header_file, person_file, _ = feh_files
+    frame = FehFrame(header_file, person_file)
+
+    with pytest.raises(ValueError, match="to_long"):
+        frame.select('PERNUM', 'AGE').to_long()
+    with pytest.raises(ValueError, match="to_long"):
+        frame.select('EARNINGS').years(1900, 1901).to_long()
+
+    # Selections made after to_long are checked when the plan runs
+    with pytest.raises(ValueError, match="to_long"):
+        frame.to_long().select('PERNUM', 'AGE').collect()
+
+def test_agg_sums_are_exact(feh_files):
+    header_file, person_file, _ = feh_files
+    frame = FehFrame(header_file, person_file).select('EARNINGS').to_long().agg(
+        {'earnings': ['sum', 'count', 'min', 'max']}, by=['year'])
+
+    # Sums past 2**53 lose precision in float64
+    big = 2**53
+    chunks = [np.array([(2006, big), (2007, 5)], dtype=[('year', 'i4'), ('earnings', 'i8')]),
+              np.array([(2006, 1), (2006, 1), (2007, -2)], dtype=[('year', 'i4'), ('earnings', 'i8')])]
+    out = frame._aggregate(iter(chunks))
+
+    assert out['year'].tolist() == [2006, 2007]
+    assert out['earnings_sum'].tolist() == [big + 2, 3]
+    assert out['earnings_count'].tolist() == [3, 2]
+    assert out['earnings_min'].tolist() == [1, -2]
+    assert out['earnings_max'].tolist() == [big, 5]
@@ -0,0 +1,47 @@
+"""
+Import-time regression tests for feh_io.
+
+Importing feh_io and reading headers must not load heavy optional
+dependencies. To run, use `pytest tests/test-import-time.py`
+"""
+
+import ast
+import glob
+import os
+import subprocess
+import sys
+import pytest
+from tests.conftest import HEADER_FILE
+
+HEAVY_MODULES = ['pandas', 'pyarrow', 'requests']
+
+def loaded_heavy_modules(code:str):
+    """Runs code in a fresh interpreter and lists the heavy modules it loaded"""
+    script = f"import sys\n{code}\nprint(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+    return [m for m in result.stdout.strip().split(',') if m]
+
+def test_import_is_light():
+    assert loaded_heavy_modules("import feh_io") == []
+
+@pytest.mark.parametrize('name', ['read_header_file', 'read_feh_data_file', 'FehReader',
+                                  'FehFrame', 'FehDataset', 'sample_feh', 'read_feh_char_file'])
+def test_core_features_are_light(name):
+    code = f"import feh_io\nfeh_io.{name}\nfeh_io.read_header_file({HEADER_FILE!r})"
+    assert loaded_heavy_modules(code) == []
+
+def test_heavy_features_load_on_use():
+    assert 'pyarrow' in loaded_heavy_modules("import feh_io\nfeh_io.save_feh_parquet")
+    assert 'requests' in loaded_heavy_modules("import feh_io\nfeh_io.DataManager")
+
+def test_unknown_attribute():
+    import feh_io
+    with pytest.raises(AttributeError):
+        feh_io.not_a_function
+
+def test_modules_parse_on_oldest_python():
+    # pyproject declares requires-python >= 3.7
+    package_dir = os.path.join(os.path.dirname(__file__), '..', 'src', 'feh_io')
+    for path in glob.glob(os.path.join(package_dir, '*.py')):
+        with open(path) as file:
+            ast.parse(file.read(), filename=path, feature_version=(3, 7))
@@ -0,0 +1,53 @@
+"""
+Tests for MTS matrix views and cross-year kernels.
+
+To run, use `pytest tests/test-mts.py`
+"""
+
+import numpy as np
+import pytest
+from feh_io.read_feh import select_vars
+from feh_io import (read_feh_data_file, mts_matrix, cumulative_sum, lifetime_sum, top_n_mean,
+                    first_nonzero_year, last_nonzero_year, count_years)
+
+YEARS = range(2006, 2011)
+
+def test_mts_matrix_is_a_view(large_feh_files):
+    header_file, person_file, _ = large_feh_files
+    data = read_feh_data_file(header_file, person_file)
+
+    matrix = mts_matrix(data, 'EARNINGS', years=(2006, 2010))
+    expected = np.stack([data[f'EARNINGS{y}'] for y in YEARS], axis=1)
+    assert matrix.shape == (len(data), 5)
+    assert np.array_equal(matrix, expected)
+    assert np.shares_memory(matrix, data)
+
+    assert mts_matrix(data, 'EARNINGS').shape[1] == 2100 - 1951 + 1
+
+    # Fields repacked out of order are copied instead
+    shuffled = select_vars(data, ['EARNINGS2007', 'EARNINGS2006'])
+    copied = mts_matrix(shuffled, 'EARNINGS', years=range(2006, 2008))
+    assert np.array_equal(copied, expected[:, :2])
+    assert not np.shares_memory(copied, shuffled)
+
+    matrix[0, 1] = 123
+    assert data['EARNINGS2007'][0] == 123
+
+    with pytest.raises(ValueError, match="Fields missing"):
+        mts_matrix(data, 'EARNINGS', years=(1940, 1960))
+
+def test_kernels():
+    matrix = np.array([[0, 5, 0, 3, 9],
+                       [0, 0, 0, 0, 0],
+                       [7, 1, 2, 0, 4]], dtype=np.int32)
+
+    assert cumulative_sum(matrix)[:, -1].tolist() == [17, 0, 14]
+    assert cumulative_sum(matrix)[0].tolist() == [0, 5, 5, 8, 17]
+    assert lifetime_sum(matrix).tolist() == [17, 0, 14]
+    assert top_n_mean(matrix, 2).tolist() == [7.0, 0.0, 5.5]
+    assert top_n_mean(matrix, 10).tolist() == [1.7, 0.0, 1.4]
+    assert first_nonzero_year(matrix, 2006).tolist() == [2007, -1, 2006]
+    assert last_nonzero_year(matrix, list(YEARS)).tolist() == [2010, -1, 2010]
+    assert count_years(matrix, '>', 2).tolist() == [3, 0, 2]
+    assert count_years(matrix, lambda m: m == 0).tolist() == [2, 5, 1]
+    assert count_years(matrix, 'in', [1, 2]).tolist() == [0, 0, 2]
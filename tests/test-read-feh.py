@@ -0,0 +1,182 @@
+"""
+Tests for reading DYNASIM FEH binary files.
+
+To run, use `pytest tests/test-read-feh.py`
+"""
+
+import gzip
+import lzma
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from feh_io import read_feh_data_file, FehReader, ConcurrentFehReader, sample_feh
+from feh_io.read_feh import count_records, iter_record_chunks
+
+def test_output_modes(feh_files):
+    header_file, person_file, _ = feh_files
+    data = read_feh_data_file(header_file, person_file)
+
+    df = read_feh_data_file(header_file, person_file, output='pandas')
+    assert isinstance(df, pd.DataFrame)
+    assert list(df.columns) == list(data.dtype.names)
+    assert np.array_equal(df['EARNINGS2006'].to_numpy(), data['EARNINGS2006'])
+
+    table = read_feh_data_file(header_file, person_file, var_list=['PERNUM', 'AGE'], output='arrow')
+    assert isinstance(table, pa.Table)
+    assert table.column_names == ['PERNUM', 'AGE']
+    assert table.column('AGE').to_pylist() == data['AGE'].tolist()
+
+    with pytest.raises(ValueError):
+        read_feh_data_file(header_file, person_file, output='polars')
+
+def test_feh_reader_output(feh_files):
+    header_file, person_file, _ = feh_files
+
+    reader = FehReader(header_file, person_file, 'person', chunk_size=4, var_list=['PERNUM'], output='pandas')
+    chunks = [reader.read_chunk() for _ in range(3)]
+    assert [len(c) for c in chunks] == [4, 4, 2]
+    assert pd.concat(chunks)['PERNUM'].tolist() == read_feh_data_file(header_file, person_file)['PERNUM'].tolist()
+
+    with pytest.raises(ValueError):
+        FehReader(header_file, person_file, 'person', output='csv')
+
+def test_sample_feh(large_feh_files):
+    header_file, person_file, _ = large_feh_files
+    data = read_feh_data_file(header_file, person_file)
+
+    sample = sample_feh(header_file, person_file, frac=0.1, seed=42)
+    assert len(sample) == 100
+    assert np.all(np.diff(sample['PERNUM']) > 0)
+    assert np.array_equal(sample, data[np.isin(data['PERNUM'], sample['PERNUM'])])
+
+    again = sample_feh(header_file, person_file, frac=0.1, seed=42, var_list=['PERNUM'])
+    assert np.array_equal(again['PERNUM'], sample['PERNUM'])
+
+    by_sex = sample_feh(header_file, person_file, n=7, seed=1, stratify_by='SEX')
+    assert np.unique(by_sex['SEX'], return_counts=True)[1].tolist() == [7, 7]
+
+    cohorts = sample_feh(header_file, person_file, n=3, seed=1, stratify_by='AGE',
+                         strata_fn=lambda age: age // 25)
+    assert np.unique(cohorts['AGE'] // 25, return_counts=True)[1].tolist() == [3, 3, 3, 3]
+
+@pytest.mark.parametrize('compress', [gzip.compress, lzma.compress])
+def test_compressed_data_file(large_feh_files, tmp_path, compress):
+    header_file, person_file, _ = large_feh_files
+    data = read_feh_data_file(header_file, person_file)
+
+    # Extension is irrelevant, compression is detected from magic bytes
+    compressed_file = str(tmp_path / 'person.dat')
+    with open(person_file, 'rb') as raw, open(compressed_file, 'wb') as out:
+        out.write(compress(raw.read()))
+
+    assert np.array_equal(read_feh_data_file(header_file, compressed_file), data)
+
+    subset = read_feh_data_file(header_file, compressed_file, var_list=['PERNUM'],
+                                count=5000, offset=data.dtype.itemsize * 990)
+    assert subset['PERNUM'].tolist() == data['PERNUM'][990:].tolist()
+
+    assert count_records(compressed_file, data.dtype) == len(data)
+    assert sum(len(c) for c in iter_record_chunks(compressed_file, data.dtype, 300)) == len(data)
+
+    reader = FehReader(header_file, compressed_file, 'person', chunk_size=300, var_list=['PERNUM', 'AGE'])
+    chunks = [reader.read_chunk() for _ in range(4)]
+    assert [len(c) for c in chunks] == [300, 300, 300, 100]
+    assert np.array_equal(np.concatenate(chunks)['AGE'], data['AGE'])
+
+    reader.reset_data()
+    assert np.array_equal(reader.read_chunk()['PERNUM'], data['PERNUM'][:300])
+    reader.close()
+
+def test_zstd_data_file(feh_files, tmp_path):
+    zstandard = pytest.importorskip('zstandard')
+    header_file, person_file, _ = feh_files
+    data = read_feh_data_file(header_file, person_file)
+
+    compressed_file = str(tmp_path / 'person.dat.zst')
+    with open(person_file, 'rb') as raw, open(compressed_file, 'wb') as out:
+        out.write(zstandard.ZstdCompressor().compress(raw.read()))
+
+    assert np.array_equal(read_feh_data_file(header_file, compressed_file), data)
+
+    reader = FehReader(header_file, compressed_file, 'person', chunk_size=4, var_list=['PERNUM'])
+    chunks = [reader.read_chunk() for _ in range(3)]
+    assert np.array_equal(np.concatenate(chunks)['PERNUM'], data['PERNUM'])
+    reader.close()
+
+def test_gzip_magic_needs_deflate_byte(feh_files, tmp_path):
+    header_file, person_file, _ = feh_files
+    data = read_feh_data_file(header_file, person_file)
+
+    # A raw file whose first field happens to start with the gzip id bytes
+    data['SEGTYPE'][0] = 0x8b1f
+    raw_file = str(tmp_path / 'person.dat')
+    data.tofile(raw_file)
+
+    assert np.array_equal(read_feh_data_file(header_file, raw_file), data)
+
+def test_concurrent_reader(large_feh_files):
+    header_file, person_file, _ = large_feh_files
+    data = read_feh_data_file(header_file, person_file)
+    rng = np.random.default_rng(3)
+    ranges = [tuple(sorted(rng.integers(0, 1100, 2))) for _ in range(64)]
+
+    with ConcurrentFehReader(header_file, person_file) as reader:
+        assert len(reader) == len(data)
+
+        def read(bounds):
+            return reader.read_rows(*bounds, var_list=['PERNUM', 'EARNINGS2008'])
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(read, ranges))
+
+        for (start, stop), rows in zip(ranges, results):
+            assert np.array_equal(rows, data[['PERNUM', 'EARNINGS2008']][start:stop])
+
+        assert np.array_equal(reader.read_rows(995), data[995:])
+        with pytest.raises(IndexError):
+            reader.read_rows(-1, 5)
+
+    with pytest.raises(ValueError, match="closed"):
+        reader.read_rows(0, 1)
+
+@pytest.mark.parametrize('missing', [['preadv'], ['preadv', 'pread']])
+def test_concurrent_reader_fallbacks(feh_files, monkeypatch, missing):
+    header_file, person_file, _ = feh_files
+    data = read_feh_data_file(header_file, person_file)
+    for name in missing:
+        monkeypatch.delattr('os.' + name, raising=False)
+
+    with ConcurrentFehReader(header_file, person_file) as reader:
+        assert np.array_equal(reader.read_rows(2, 7), data[2:7])
+
+def test_concurrent_reader_close_waits_for_reads(feh_files):
+    header_file, person_file, _ = feh_files
+    data = read_feh_data_file(header_file, person_file)
+    reader = ConcurrentFehReader(header_file, person_file)
+
+    # Hold a read inside the descriptor until close() has been called
+    started, release = threading.Event(), threading.Event()
+    read_into = reader._read_into
+    def slow_read_into(buffer, offset):
+        started.set()
+        release.wait()
+        read_into(buffer, offset)
+    reader._read_into = slow_read_into
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        rows = executor.submit(reader.read_rows, 0, 5)
+        started.wait()
+        closing = executor.submit(reader.close)
+        assert not closing.done()
+
+        release.set()
+        assert np.array_equal(rows.result(), data[:5])
+        closing.result()
+
+    assert reader.fd is None
+    with pytest.raises(ValueError, match="closed"):
+        reader.read_rows(0, 1)
+    reader.close()
@@ -0,0 +1,74 @@
+"""
+Tests for the parquet and arrow writers.
+
+To run, use `pytest tests/test-save-feh.py`
+"""
+
+import re
+import numpy as np
+import pytest
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from feh_io import save_feh_parquet_dataset, save_feh_arrow, load_feh_arrow, read_feh_data_file
+
+def test_parquet_dataset(large_feh_files, tmp_path):
+    header_file, person_file, _ = large_feh_files
+    data = read_feh_data_file(header_file, person_file)
+    out_dir = str(tmp_path / 'dataset')
+
+    nrec = save_feh_parquet_dataset(
+        header_file, person_file, out_dir,
+        partition_by={'SEX': 'SEX', 'BIRTH_DECADE': lambda d: (2006 - d['AGE']) // 10 * 10},
+        var_list=['PERNUM', 'AGE', 'EARNINGS2006'],
+        sort_by='PERNUM',
+        chunk_size=300)
+    assert nrec == len(data)
+
+    dataset = ds.dataset(out_dir, format='parquet', partitioning='hive')
+    assert sorted(dataset.schema.names) == ['AGE', 'BIRTH_DECADE', 'EARNINGS2006', 'PERNUM', 'SEX']
+    assert dataset.count_rows() == len(data)
+
+    # A cohort query only touches its own partition files
+    cohort = (data['SEX'] == 1) & ((2006 - data['AGE']) // 10 * 10 == 1960)
+    filtered = ds.field('SEX') == 1
+    filtered &= ds.field('BIRTH_DECADE') == 1960
+    assert len(list(dataset.get_fragments(filter=filtered))) == 1
+    table = dataset.to_table(filter=filtered)
+    assert sorted(table['PERNUM'].to_pylist()) == sorted(data['PERNUM'][cohort].tolist())
+
+    # Every row group is sorted by PERNUM
+    for fragment in dataset.get_fragments():
+        parquet_file = pq.ParquetFile(fragment.path)
+        for i in range(parquet_file.num_row_groups):
+            pernum = parquet_file.read_row_group(i, columns=['PERNUM'])['PERNUM'].to_numpy()
+            assert np.all(np.diff(pernum) >= 0)
+
+    # Writing again replaces the partitions
+    save_feh_parquet_dataset(header_file, person_file, out_dir, partition_by='SEX', var_list=['PERNUM'])
+    files = sorted(str(fragment.path) for fragment in ds.dataset(out_dir, format='parquet').get_fragments())
+    assert all(re.search(r'SEX=\d+/part-0\.parquet$', path) for path in files)
+    assert ds.dataset(out_dir, format='parquet', partitioning='hive').count_rows() == len(data)
+
+@pytest.mark.parametrize('compression', [None, 'lz4'])
+def test_arrow_round_trip(large_feh_files, tmp_path, compression):
+    header_file, person_file, _ = large_feh_files
+    data = read_feh_data_file(header_file, person_file, var_list=['PERNUM', 'AGE', 'EARNINGS2006'])
+
+    path = save_feh_arrow(data, str(tmp_path), 'person', compression=compression)
+    assert path.endswith('person.arrow')
+
+    table = load_feh_arrow(path)
+    assert table.column_names == ['PERNUM', 'AGE', 'EARNINGS2006']
+    assert np.array_equal(table['AGE'].to_numpy(), data['AGE'])
+
+    columns = load_feh_arrow(path, var_list=['EARNINGS2006'], output='numpy')
+    assert list(columns) == ['EARNINGS2006']
+    assert np.array_equal(columns['EARNINGS2006'], data['EARNINGS2006'])
+
+    # Uncompressed columns are read-only views of the mapped file
+    if compression is None:
+        assert not columns['EARNINGS2006'].flags.owndata
+        assert not columns['EARNINGS2006'].flags.writeable
+
+    with pytest.raises(ValueError, match="Fields missing"):
+        load_feh_arrow(path, var_list=['AEG'])
@@ -0,0 +1,58 @@
+"""
+Tests for the deduplicated scenario store.
+
+To run, use `pytest tests/test-scenario-store.py`
+"""
+
+import os
+import numpy as np
+import pytest
+from feh_io import ScenarioStore, read_feh_data_file
+
+def test_baseline_and_delta_runs(large_feh_files, tmp_path):
+    header_file, person_file, _ = large_feh_files
+    data = read_feh_data_file(header_file, person_file)
+
+    # A reform that changes one variable for a few people
+    reform = data.copy()
+    reform['EARNINGS2008'][300:310] += 1000
+    reform['AGE'][999] = 42
+    reform_file = str(tmp_path / 'reform_person.dat')
+    reform.tofile(reform_file)
+
+    store_dir = str(tmp_path / 'store')
+    store = ScenarioStore.create(store_dir, header_file, person_file, block_records=128)
+    assert store.add_run('reform-1', reform_file) == 2
+    assert store.add_run('same', person_file) == 0
+
+    # Reopened from disk
+    store = ScenarioStore(store_dir)
+    assert store.runs == ['baseline', 'reform-1', 'same']
+    blocks = store.run_blocks('reform-1')
+    names = list(store.names)
+    assert sorted(zip(blocks['column'].tolist(), blocks['block'].tolist())) == \
+        sorted([(names.index('EARNINGS2008'), 2), (names.index('AGE'), 7)])
+    assert os.path.getsize(os.path.join(store_dir, 'runs', 'reform-1.dat')) == 4 * (128 + 1000 - 7*128)
+
+    assert np.array_equal(store.read(), data)
+    assert np.array_equal(store.read('same'), data)
+    assert np.array_equal(store.read('reform-1'), reform)
+
+    projected = store.read('reform-1', var_list=['PERNUM', 'EARNINGS2008'])
+    assert projected.dtype.names == ('PERNUM', 'EARNINGS2008')
+    assert np.array_equal(projected, reform[['PERNUM', 'EARNINGS2008']])
+
+    with pytest.raises(ValueError, match="Fields missing"):
+        store.read('reform-1', var_list=['EARNIGNS2008'])
+    with pytest.raises(ValueError, match="run can be one of"):
+        store.read('reform-2')
+
+def test_run_must_match_baseline(large_feh_files, tmp_path):
+    header_file, person_file, _ = large_feh_files
+    small_person_file = str(tmp_path / 'small_person.dat')
+    read_feh_data_file(header_file, person_file, count=10).tofile(small_person_file)
+
+    store = ScenarioStore.create(str(tmp_path / 'store'), header_file, person_file, block_records=128)
+    with pytest.raises(ValueError, match="records"):
+        store.add_run('short', small_person_file)
+    assert store.runs == ['baseline']
@@ -0,0 +1,68 @@
+"""
+Tests for loading DYNASIM data into shared memory.
+
+To run, use `pytest tests/test-shared-feh.py`
+"""
+
+import gzip
+import numpy as np
+import pytest
+from concurrent.futures import ProcessPoolExecutor
+from feh_io import SharedFehArray, read_feh_data_file
+
+def _worker_sum(spec):
+    shared = SharedFehArray.attach(spec)
+    try:
+        assert not shared.array.flags.writeable
+        return int(shared.array['AGE'].astype(np.int64).sum())
+    finally:
+        shared.close()
+
+def test_create_and_attach(large_feh_files):
+    header_file, person_file, _ = large_feh_files
+    data = read_feh_data_file(header_file, person_file, var_list=['PERNUM', 'AGE'])
+
+    with SharedFehArray.create(header_file, person_file, var_list=['PERNUM', 'AGE'], chunk_size=128) as shared:
+        assert shared.array.dtype.names == ('PERNUM', 'AGE')
+        assert np.array_equal(shared.array, data)
+
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            sums = list(executor.map(_worker_sum, [shared.spec] * 4))
+        assert sums == [int(data['AGE'].astype(np.int64).sum())] * 4
+
+        # Workers closing their views leaves the segment in place
+        reader = SharedFehArray.attach(shared.spec)
+        assert np.array_equal(reader.array, data)
+        with pytest.raises(ValueError):
+            reader.array['AGE'][0] = 1
+        reader.close()
+        spec = shared.spec
+
+    # The owner unlinks the segment on exit
+    with pytest.raises(FileNotFoundError):
+        SharedFehArray.attach(spec)
+
+def test_full_records(feh_files):
+    header_file, person_file, _ = feh_files
+    data = read_feh_data_file(header_file, person_file)
+
+    shared = SharedFehArray.create(header_file, person_file)
+    assert np.array_equal(shared.array, data)
+    spec = shared.spec
+    del shared
+
+    # Garbage collection of the owner unlinks the segment too
+    with pytest.raises(FileNotFoundError):
+        SharedFehArray.attach(spec)
+
+def test_compressed_data_file(large_feh_files, tmp_path):
+    header_file, person_file, _ = large_feh_files
+    data = read_feh_data_file(header_file, person_file, var_list=['PERNUM', 'AGE'])
+
+    compressed_file = str(tmp_path / 'person.dat.gz')
+    with open(person_file, 'rb') as raw, open(compressed_file, 'wb') as out:
+        out.write(gzip.compress(raw.read()))
+
+    with SharedFehArray.create(header_file, compressed_file, var_list=['PERNUM', 'AGE'], chunk_size=300) as shared:
+        assert len(shared) == len(data)
+        assert np.array_equal(shared.array, data)
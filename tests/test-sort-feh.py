@@ -0,0 +1,40 @@
+"""
+Tests for the out-of-core sort of DYNASIM FEH data files.
+
+To run, use `pytest tests/test-sort-feh.py`
+"""
+
+import gzip
+import numpy as np
+import pytest
+from feh_io import read_feh_data_file, sort_feh_file
+
+@pytest.mark.parametrize('key', ['AGE', ['SEX', 'AGE'], ['SEX', 'AGE', 'EARNINGS2006']])
+def test_sort_feh_file(large_feh_files, tmp_path, key):
+    header_file, person_file, _ = large_feh_files
+    data = read_feh_data_file(header_file, person_file)
+    fields = [key] if isinstance(key, str) else key
+
+    # A budget of a few hundred records forces several runs and a multi-way merge
+    out_file = str(tmp_path / 'sorted.dat')
+    nrec = sort_feh_file(header_file, person_file, out_file, key=key,
+                         memory_budget=250 * data.dtype.itemsize)
+    assert nrec == len(data)
+
+    # Same order as a stable in-memory sort
+    expected = data[np.lexsort([data[f] for f in reversed(fields)])]
+    assert np.array_equal(read_feh_data_file(header_file, out_file), expected)
+
+def test_sort_compressed_family_file(large_feh_files, tmp_path):
+    header_file, _, family_file = large_feh_files
+    data = read_feh_data_file(header_file, family_file, file_type='family')
+
+    compressed_file = str(tmp_path / 'family.dat.gz')
+    with open(family_file, 'rb') as raw, open(compressed_file, 'wb') as out:
+        out.write(gzip.compress(raw.read()))
+
+    out_file = str(tmp_path / 'sorted.dat')
+    sort_feh_file(header_file, compressed_file, out_file, key='MEMBERS', file_type='family',
+                  memory_budget=10 * data.dtype.itemsize)
+    sorted_data = read_feh_data_file(header_file, out_file, file_type='family')
+    assert np.array_equal(sorted_data, data[np.argsort(data['MEMBERS'], kind='stable')])
@@ -0,0 +1,63 @@
+"""
+Tests for the sparse MTS representation.
+
+To run, use `pytest tests/test-sparse-mts.py`
+"""
+
+import numpy as np
+import pytest
+import feh_io.sparse_mts as sparse_mts
+from feh_io import SparseMts, read_feh_data_file, mts_matrix
+
+def test_from_reader(large_feh_files, monkeypatch):
+    header_file, person_file, _ = large_feh_files
+    data = read_feh_data_file(header_file, person_file)
+    dense = mts_matrix(data, 'EARNINGS', years=(2006, 2010))
+
+    sparse = SparseMts.from_reader(header_file, person_file, 'EARNINGS', years=(2006, 2010), chunk_size=300)
+    assert len(sparse) == len(data)
+    assert np.array_equal(sparse.ids, data['PERNUM'])
+    assert np.array_equal(sparse.to_dense(), dense)
+    assert sparse.sum().tolist() == dense.sum(axis=1, dtype=np.int64).tolist()
+    assert sparse.count_nonzero().tolist() == np.count_nonzero(dense, axis=1).tolist()
+    assert len(sparse.payload) < dense.size
+
+    # Long format holds every nonzero cell, keyed by year and PERNUM
+    long = sparse.to_long()
+    assert long.dtype.names == ('year', 'pernum', 'earnings')
+    nonzero = long[long['earnings'] != 0]
+    rows, cols = np.nonzero(dense)
+    assert sorted(zip(nonzero['pernum'].tolist(), nonzero['year'].tolist())) == \
+        sorted(zip(data['PERNUM'][rows].tolist(), (2006 + cols).tolist()))
+
+    # The default chunk size is bounded by bytes of 16 KB records
+    chunk_sizes = []
+    class RecordingReader(sparse_mts.FehReader):
+        def __init__(self, *args, **kwargs):
+            chunk_sizes.append(kwargs['chunk_size'])
+            super().__init__(*args, **kwargs)
+    monkeypatch.setattr(sparse_mts, 'FehReader', RecordingReader)
+
+    default = SparseMts.from_reader(header_file, person_file, 'EARNINGS', years=(2006, 2010))
+    assert np.array_equal(default.to_dense(), dense)
+    assert chunk_sizes == [sparse_mts.SPARSE_CHUNK_BYTES // data.dtype.itemsize]
+
+    with pytest.raises(ValueError, match="Fields missing"):
+        SparseMts.from_reader(header_file, person_file, 'EARNIGNS')
+
+def test_spans_and_fill():
+    matrix = np.array([[-1, 5, 0, 3, -1],
+                       [-1, -1, -1, -1, -1],
+                       [7, -1, 2, -1, 4]], dtype=np.int32)
+
+    sparse = SparseMts.from_matrix(matrix, 'WEDSTATE', 2006, fill=-1)
+    assert sparse.first.tolist() == [1, -1, 0]
+    assert sparse.last.tolist() == [3, -1, 4]
+    assert sparse.payload.tolist() == [5, 0, 3, 7, -1, 2, -1, 4]
+    assert np.array_equal(sparse.to_dense(), matrix)
+    assert sparse.sum().tolist() == matrix.sum(axis=1).tolist()
+    assert sparse.count_nonzero().tolist() == np.count_nonzero(matrix, axis=1).tolist()
+
+    joined = SparseMts.concatenate([sparse, sparse])
+    assert np.array_equal(joined.to_dense(), np.concatenate([matrix, matrix]))
+    assert joined.to_long()['record'].tolist() == [0, 0, 0, 2, 2, 2, 2, 2, 3, 3, 3, 5, 5, 5, 5, 5]
@@ -0,0 +1,71 @@
+"""
+Tests for year-over-year transition counts.
+
+To run, use `pytest tests/test-transitions.py`
+"""
+
+import gzip
+import shutil
+from collections import Counter
+import numpy as np
+import pytest
+from feh_io import transition_counts
+from tests.conftest import make_person_records, make_family_records, write_run
+
+YEARS = range(2006, 2011)
+
+@pytest.fixture
+def wedstate_files(tmp_path):
+    person = make_person_records(1000)
+    rng = np.random.default_rng(7)
+    for year in YEARS:
+        person[f'WEDSTATE{year}'] = rng.integers(1, 5, len(person))
+    return person, write_run(str(tmp_path / 'run'), person, make_family_records(100))
+
+def expected_counts(person, groups):
+    counts = Counter()
+    for year in YEARS[1:]:
+        pairs = zip(person[f'WEDSTATE{year-1}'].tolist(), person[f'WEDSTATE{year}'].tolist(), groups.tolist())
+        counts.update((from_state, to_state, year, group) for from_state, to_state, group in pairs)
+    return counts
+
+def as_dict(counts):
+    return {tuple(row[:4]): row[4] for row in counts.tolist()}
+
+@pytest.mark.parametrize('max_workers, use_threads', [(1, False), (3, True), (2, False)])
+def test_transition_counts(wedstate_files, max_workers, use_threads):
+    person, (header_file, person_file, _) = wedstate_files
+
+    counts = transition_counts(header_file, person_file, 'WEDSTATE', years=(2006, 2010), by='SEX',
+                               chunk_size=100, max_workers=max_workers, use_threads=use_threads)
+    assert counts.dtype.names == ('from_state', 'to_state', 'year', 'sex', 'count')
+    assert counts['count'].sum() == len(person) * 4
+
+    assert as_dict(counts) == dict(expected_counts(person, person['SEX']))
+
+def test_by_fn_and_compressed(wedstate_files, tmp_path):
+    person, (header_file, person_file, _) = wedstate_files
+    gz_file = str(tmp_path / 'person.dat.gz')
+    with open(person_file, 'rb') as src, gzip.open(gz_file, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+
+    counts = transition_counts(header_file, gz_file, 'WEDSTATE', years=(2006, 2010), by='AGE',
+                               by_fn=lambda age: (2006 - age) // 10 * 10, chunk_size=300)
+    assert as_dict(counts) == dict(expected_counts(person, (2006 - person['AGE']) // 10 * 10))
+
+    # Without groups
+    counts = transition_counts(header_file, person_file, 'WEDSTATE', years=(2009, 2010), max_workers=1)
+    assert counts.dtype.names == ('from_state', 'to_state', 'year', 'count')
+    assert counts['year'].tolist() == [2010] * 16
+
+    with pytest.raises(ValueError, match="Fields missing"):
+        transition_counts(header_file, person_file, 'WEDSTAT')
+
+def test_empty_file(wedstate_files, tmp_path):
+    _, (header_file, _, _) = wedstate_files
+    empty_file = str(tmp_path / 'empty_person.dat')
+    open(empty_file, 'wb').close()
+
+    counts = transition_counts(header_file, empty_file, 'WEDSTATE', years=(2006, 2010), by='SEX', max_workers=1)
+    assert len(counts) == 0
+    assert counts.dtype.names == ('from_state', 'to_state', 'year', 'sex', 'count')